@@ -0,0 +1,108 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from foodgram.settings import (TOKEN_CACHE_SHARED, TOKEN_CACHE_SIZE,
+                               TOKEN_CACHE_TTL)
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+# Эти поля не попадают в общий кэш: у загруженного из него пользователя
+# они отложены и читаются из базы только при обращении.
+SHARED_EXCLUDED_FIELDS = ('password',)
+
+
+def dump_shared(value):
+    user, token = value
+    return (
+        {
+            field.attname: getattr(user, field.attname)
+            for field in User._meta.concrete_fields
+            if field.attname not in SHARED_EXCLUDED_FIELDS
+        },
+        token.created
+    )
+
+
+def load_shared(key, value):
+    fields, created = value
+    # Отложенный пароль к тому же не перезапишется при save(): Django
+    # сохраняет у такого объекта только загруженные поля.
+    user = User.from_db(DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+    token = Token.from_db(
+        DEFAULT_DB_ALIAS, ['key', 'user_id', 'created'],
+        [key, user.pk, created]
+    )
+    token.user = user
+    return user, token
+
+
+class TokenCache:
+    def __init__(self, size, ttl, shared):
+        self.size = size
+        self.ttl = ttl
+        self.shared = shared
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def shared_key(self, key):
+        # В общий кэш попадает только хэш токена, а не сам токен.
+        return f'auth_token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    return entry[1]
+                del self.entries[key]
+        if not self.shared:
+            return None
+        value = cache.get(self.shared_key(key))
+        if value is None:
+            return None
+        value = load_shared(key, value)
+        self.store(key, value)
+        return value
+
+    def store(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def set(self, key, value):
+        self.store(key, value)
+        if self.shared:
+            cache.set(self.shared_key(key), dump_shared(value), self.ttl)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if self.shared:
+            cache.delete_many([self.shared_key(key) for key in keys])
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL, TOKEN_CACHE_SHARED)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        value = token_cache.get(key)
+        if value is None:
+            value = super().authenticate_credentials(key)
+            token_cache.set(key, value)
+        user, token = value
+        # Каждый запрос получает свою копию пользователя, чтобы изменения
+        # атрибутов во view не попадали в общий кэш.
+        return copy.copy(user), token
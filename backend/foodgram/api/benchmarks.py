@@ -0,0 +1,115 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+from .cache import bump_reference_version
+
+WORDS = (
+    'борщ', 'суп', 'салат', 'курица', 'говядина', 'картофель', 'сыр',
+    'грибы', 'пирог', 'блины', 'рыба', 'рис', 'паста', 'томаты', 'лук',
+    'морковь', 'чеснок', 'сметана', 'яблоко', 'творог', 'тыква', 'капуста',
+    'свёкла', 'укроп', 'перец', 'баклажан', 'кабачок', 'фасоль', 'гречка',
+    'овсянка',
+)
+
+SEED_TAGS = 10
+SEED_AUTHORS = 100
+SEED_INGREDIENTS = 500
+SEED_BATCH_SIZE = 5000
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return (
+        f'медиана {statistics.median(timings):.2f} мс, '
+        f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f} мс'
+    )
+
+
+def measure(function, arguments):
+    timings, results = [], []
+    for argument in arguments:
+        started = time.perf_counter()
+        results.append(function(argument))
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, results
+
+
+def phrase(generator, words):
+    return ' '.join(generator.choice(WORDS) for _ in range(words))
+
+
+def seed(count, generator):
+    tags = Tag.objects.bulk_create([
+        Tag(name=f'Замер {number}', slug=f'benchmark-{number}',
+            color=f'#ff{number:04d}')
+        for number in range(SEED_TAGS)
+    ])
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(name=f'Замер {number}', measurement_unit='г')
+        for number in range(SEED_INGREDIENTS)
+    ])
+    authors = User.objects.bulk_create([
+        User(username=f'benchmark{number}',
+             email=f'benchmark{number}@example.com',
+             password=f'!benchmark{number}',
+             first_name='Замер', last_name='Замер')
+        for number in range(SEED_AUTHORS)
+    ])
+    reader = authors[0]
+    for start in range(0, count, SEED_BATCH_SIZE):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(author=generator.choice(authors),
+                   name=phrase(generator, 2).capitalize(),
+                   text=phrase(generator, 30),
+                   cooking_time=generator.randint(5, 120),
+                   image='recipes/images/benchmark.png')
+            for _ in range(min(SEED_BATCH_SIZE, count - start))
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in generator.sample(tags, generator.randint(1, 3))
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in generator.sample(
+                ingredients, generator.randint(3, 8)
+            )
+        ])
+        for through in (User.favorite_recipes.through,
+                        User.shopping_cart.through):
+            through.objects.bulk_create([
+                through(user=reader, recipe=recipe)
+                for recipe in recipes if generator.random() < 0.01
+            ])
+    return reader, [tag.slug for tag in tags]
+
+
+@contextmanager
+def benchmark_data(count, seed_value=0):
+    # Синтетические рецепты живут только внутри транзакции замера и
+    # откатываются вместе с ней; без count замер идёт на текущих данных.
+    with transaction.atomic():
+        if count:
+            reader, slugs = seed(count, random.Random(seed_value))
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            bump_reference_version('tags')
+        else:
+            reader = User.objects.order_by('pk').first()
+            slugs = list(Tag.objects.values_list('slug', flat=True))
+        try:
+            yield reader, slugs
+        finally:
+            if count:
+                transaction.set_rollback(True)
+    if count:
+        bump_reference_version('tags')
@@ -0,0 +1,108 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from foodgram.settings import (RECIPE_COUNTERS_CACHE_INTERVAL,
+                               SHOPPING_LIST_CACHE_MAX_SIZE,
+                               SHOPPING_LIST_CACHE_TIMEOUT)
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def shopping_list_version(user_id):
+    # get_or_set кладёт значение через add, поэтому параллельные запросы
+    # получают одну и ту же версию.
+    return cache.get_or_set(
+        f'shopping_list:{user_id}:version', time.time_ns, timeout=None
+    )
+
+
+def invalidate_shopping_list(*user_ids):
+    version = time.time_ns()
+    cache.set_many(
+        {f'shopping_list:{user_id}:version': version for user_id in user_ids},
+        timeout=None
+    )
+
+
+def shopping_list_key(user_id, version, format):
+    return f'shopping_list:{user_id}:{version}:{format}'
+
+
+def cache_stream(chunks, key):
+    parts, size = [], 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            if size > SHOPPING_LIST_CACHE_MAX_SIZE:
+                parts = None
+            else:
+                parts.append(chunk)
+        yield chunk
+    if parts is not None:
+        cache.set(key, b''.join(parts), SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def reference_version(name):
+    return cache.get_or_set(f'{name}:version', time.time_ns, timeout=None)
+
+
+def bump_reference_version(name):
+    version = time.time_ns()
+    cache.set(f'{name}:version', version, timeout=None)
+    return version
+
+
+def bump_reference_version_on_commit(name):
+    transaction.on_commit(lambda: bump_reference_version(name))
+
+
+def bump_recipe_counters(recipe_ids):
+    # Ответ с одним рецептом зависит от версии этого рецепта и обновляется
+    # сразу. Списки зависят от общей версии счётчиков, которая сдвигается
+    # не чаще раза в RECIPE_COUNTERS_CACHE_INTERVAL: иначе каждое
+    # добавление в избранное сбрасывало бы весь кэш списков, а отставание
+    # счётчиков в них ограничено ANONYMOUS_CACHE_TIMEOUT.
+    version = time.time_ns()
+    cache.set_many(
+        {f'recipe:{pk}:version': version for pk in recipe_ids}, timeout=None
+    )
+    if cache.add('recipe_counters:throttle', version,
+                 RECIPE_COUNTERS_CACHE_INTERVAL):
+        cache.set('recipe_counters:version', version, timeout=None)
+
+
+def bump_recipe_counters_on_commit(recipe_ids):
+    transaction.on_commit(lambda: bump_recipe_counters(recipe_ids))
+
+
+def response_version(*names):
+    keys = [f'{name}:version' for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return '-'.join(str(versions[key]) for key in keys)
+
+
+def response_key(request, version):
+    # Порядок параметров и повторяющихся значений не влияет на ответ,
+    # поэтому ?tags=a&tags=b и ?tags=b&tags=a дают один ключ.
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        for value in values
+    ))
+    digest = hashlib.sha256('\n'.join((
+        request.get_host(),
+        request.path,
+        query,
+        request.META.get('HTTP_ACCEPT', ''),
+    )).encode()).hexdigest()
+    return f'response:{version}:{digest}'
+
+
+def response_etag(content):
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
@@ -0,0 +1,152 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+
+from foodgram.settings import COOKING_INDEX_MAX_DELTAS, COOKING_INDEX_TTL
+
+from django.core.cache import cache
+
+from recipes.models import RecipeIngredient
+from .cache import bump_reference_version, reference_version
+
+Snapshot = namedtuple(
+    'Snapshot', ('version', 'loaded', 'postings', 'sizes')
+)
+
+
+class CookingIndex:
+    # Инвертированный индекс «ингредиент -> отсортированные id рецептов»
+    # и число ингредиентов каждого рецепта. Снимок не изменяется на месте:
+    # обновление собирает новый и подменяет ссылку целиком.
+    name = 'recipe_ingredients'
+
+    def __init__(self):
+        self.snapshot = None
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def is_fresh(self, snapshot, version):
+        return (
+            snapshot is not None
+            and snapshot.version == version
+            and time.monotonic() - snapshot.loaded < COOKING_INDEX_TTL
+        )
+
+    def build(self, version):
+        postings, sizes = {}, {}
+        rows = RecipeIngredient.objects.order_by(
+            'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+            postings.setdefault(ingredient_id, array('L')).append(recipe_id)
+            sizes[recipe_id] = sizes.get(recipe_id, 0) + 1
+        return Snapshot(version, time.monotonic(), postings, sizes)
+
+    def delta_key(self, version):
+        return f'{self.name}:delta:{version}'
+
+    def apply(self, snapshot, version, recipe_id, old_ids, new_ids):
+        old_ids, new_ids = set(old_ids), set(new_ids)
+        postings = dict(snapshot.postings)
+        for ingredient_id in old_ids - new_ids:
+            recipes = array('L', postings.get(ingredient_id, ()))
+            position = bisect_left(recipes, recipe_id)
+            if position < len(recipes) and recipes[position] == recipe_id:
+                del recipes[position]
+            postings[ingredient_id] = recipes
+        for ingredient_id in new_ids - old_ids:
+            recipes = array('L', postings.get(ingredient_id, ()))
+            position = bisect_left(recipes, recipe_id)
+            if position == len(recipes) or recipes[position] != recipe_id:
+                recipes.insert(position, recipe_id)
+            postings[ingredient_id] = recipes
+        sizes = dict(snapshot.sizes)
+        if new_ids:
+            sizes[recipe_id] = len(new_ids)
+        else:
+            sizes.pop(recipe_id, None)
+        return Snapshot(version, snapshot.loaded, postings, sizes)
+
+    def catch_up(self, snapshot, version):
+        # Версия индекса — счётчик правок, а каждая правка лежит в кэше
+        # под своим номером. Отставший снимок догоняет их по порядку и
+        # перестраивается, только если какой-то правки уже нет.
+        if (
+            snapshot is None
+            or time.monotonic() - snapshot.loaded >= COOKING_INDEX_TTL
+            or not 0 < version - snapshot.version <= COOKING_INDEX_MAX_DELTAS
+        ):
+            return None
+        keys = [
+            self.delta_key(number)
+            for number in range(snapshot.version + 1, version + 1)
+        ]
+        deltas = cache.get_many(keys)
+        if len(deltas) != len(keys):
+            return None
+        for number, key in enumerate(keys, snapshot.version + 1):
+            snapshot = self.apply(snapshot, number, *deltas[key])
+        return snapshot
+
+    def get(self):
+        version = reference_version(self.name)
+        snapshot = self.snapshot
+        if self.is_fresh(snapshot, version):
+            return snapshot
+        if not self.lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if not self.is_fresh(self.snapshot, version):
+                self.snapshot = (
+                    self.catch_up(self.snapshot, version)
+                    or self.build(version)
+                )
+            return self.snapshot
+        finally:
+            self.lock.release()
+
+    def publish(self, delta):
+        reference_version(self.name)
+        try:
+            version = cache.incr(f'{self.name}:version')
+        except ValueError:
+            # Счётчик вытеснен из кэша: новая версия заставит все
+            # процессы перестроить индекс.
+            return None, bump_reference_version(self.name)
+        cache.set(self.delta_key(version), delta, COOKING_INDEX_TTL)
+        return version - 1, version
+
+    def update_recipe(self, recipe_id, old_ids, new_ids):
+        delta = (recipe_id, tuple(set(old_ids)), tuple(set(new_ids)))
+        with self.lock:
+            previous, version = self.publish(delta)
+            snapshot = self.snapshot
+            # Если индекс отстал, свою правку он получит вместе с
+            # остальными при следующем чтении.
+            if snapshot is None or snapshot.version != previous:
+                return
+            self.snapshot = self.apply(snapshot, version, *delta)
+
+    def match(self, ingredient_ids, limit, max_missing=None):
+        snapshot = self.get()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(snapshot.postings.get(ingredient_id, ()))
+        ranked = (
+            (snapshot.sizes.get(recipe_id, count) - count, -count, -recipe_id)
+            for recipe_id, count in matched.items()
+        )
+        if max_missing is not None:
+            ranked = (item for item in ranked if item[0] <= max_missing)
+        return [
+            (-recipe_id, -count, missing)
+            for missing, count, recipe_id in heapq.nsmallest(limit, ranked)
+        ]
+
+
+cooking_index = CookingIndex()
@@ -0,0 +1,88 @@
+from foodgram.settings import FEED_BACKFILL_SIZE, FEED_MAX_FOLLOWS
+
+from django.db import connection
+from django.db.models import Exists, F, OuterRef
+
+from recipes.models import FeedItem, Recipe
+from users.models import Follow
+
+
+def tables():
+    quote = connection.ops.quote_name
+    return (
+        quote(FeedItem._meta.db_table),
+        quote(Follow._meta.db_table),
+        quote(Recipe._meta.db_table),
+    )
+
+
+def is_materialized(user_id):
+    # Для читателей с большим числом подписок лента не хранится:
+    # каждый новый рецепт пришлось бы копировать им слишком часто,
+    # поэтому такая лента собирается при чтении.
+    return (
+        Follow.objects.filter(user_id=user_id).count() <= FEED_MAX_FOLLOWS
+    )
+
+
+def fan_out(recipe):
+    feed, follow, _ = tables()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {feed} (user_id, recipe_id, pub_date) '
+            f'SELECT f.user_id, %s, %s FROM {follow} f '
+            f'WHERE f.following_id = %s AND ('
+            f'SELECT COUNT(*) FROM {follow} c WHERE c.user_id = f.user_id'
+            f') <= %s ON CONFLICT DO NOTHING',
+            [recipe.pk, recipe.pub_date, recipe.author_id, FEED_MAX_FOLLOWS]
+        )
+
+
+def backfill(user_id, author_id=None):
+    feed, follow, recipe = tables()
+    if author_id is None:
+        condition = (
+            f'r.author_id IN (SELECT following_id FROM {follow} '
+            f'WHERE user_id = %s)'
+        )
+        params = [user_id, user_id, FEED_BACKFILL_SIZE]
+    else:
+        condition = 'r.author_id = %s'
+        params = [user_id, author_id, FEED_BACKFILL_SIZE]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {feed} (user_id, recipe_id, pub_date) '
+            f'SELECT %s, r.id, r.pub_date FROM {recipe} r '
+            f'WHERE {condition} '
+            f'ORDER BY r.pub_date DESC, r.id DESC LIMIT %s '
+            f'ON CONFLICT DO NOTHING',
+            params
+        )
+
+
+def followed(user_id, author_id):
+    follows = Follow.objects.filter(user_id=user_id).count()
+    if follows <= FEED_MAX_FOLLOWS:
+        backfill(user_id, author_id)
+    elif follows == FEED_MAX_FOLLOWS + 1:
+        FeedItem.objects.filter(user_id=user_id).delete()
+
+
+def unfollowed(user_id, author_id):
+    follows = Follow.objects.filter(user_id=user_id).count()
+    if follows == FEED_MAX_FOLLOWS:
+        backfill(user_id)
+    elif follows < FEED_MAX_FOLLOWS:
+        FeedItem.objects.filter(
+            user_id=user_id, recipe__author_id=author_id
+        ).delete()
+
+
+def feed_queryset(queryset, user):
+    if is_materialized(user.pk):
+        return queryset.filter(feed_items__user=user).annotate(
+            feed_pub_date=F('feed_items__pub_date')
+        )
+    return queryset.filter(
+        Exists(Follow.objects.filter(user=user, following=OuterRef('author')))
+    ).annotate(feed_pub_date=F('pub_date'))
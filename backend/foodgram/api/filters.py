@@ -1,21 +1,26 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework
 
-from rest_framework.filters import SearchFilter
-
 from recipes.models import Recipe
-
-
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+from users.models import User
+from . import reference
 
 
 class RecipeFilter(rest_framework.FilterSet):
+    search = rest_framework.CharFilter(method='filter_search')
     author = rest_framework.NumberFilter(field_name='author__pk')
     tags = rest_framework.CharFilter(method='filter_tags')
     is_favorited = rest_framework.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = rest_framework.NumberFilter(
         method='filter_is_in_shopping_cart'
     )
+    ordering = rest_framework.OrderingFilter(
+        fields=(
+            ('pub_date', 'pub_date'),
+            ('favorites_count', 'popular'),
+            ('in_carts_count', 'in_carts'),
+        )
+    )
 
     class Meta:
         model = Recipe
@@ -24,24 +29,41 @@ class RecipeFilter(rest_framework.FilterSet):
             'tags'
         )
 
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return queryset.search(value).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
+
     def filter_tags(self, queryset, name, value):
-        return queryset.filter(
-            tags__slug__in=self.request.GET.getlist('tags')).distinct()
+        slugs = set(self.request.GET.getlist('tags'))
+        tag_ids = [
+            tag['id'] for tag in reference.tags.get().items
+            if tag['slug'] in slugs
+        ]
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=tag_ids
+        )))
 
-    def filter_is_favorited(self, queryset, name, value):
-        if value == 1:
-            queryset = queryset.filter(users_who_favorited=self.request.user)
-            return queryset
-        if value == 0:
-            queryset = queryset.exclude(users_who_favorited=self.request.user)
+    def filter_user_relation(self, queryset, through, value):
+        if value not in (0, 1):
             return queryset
-        return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none() if value == 1 else queryset
+        related = Exists(through.objects.filter(
+            user=self.request.user,
+            recipe=OuterRef('pk')
+        ))
+        return queryset.filter(related if value == 1 else ~related)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(
+            queryset, User.favorite_recipes.through, value
+        )
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if value == 1:
-            queryset = queryset.filter(users_who_shopped=self.request.user)
-            return queryset
-        if value == 0:
-            queryset = queryset.exclude(users_who_shopped=self.request.user)
-            return queryset
-        return queryset
+        return self.filter_user_relation(
+            queryset, User.shopping_cart.through, value
+        )
@@ -0,0 +1,96 @@
+import hashlib
+import io
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from foodgram.settings import (RECIPE_IMAGE_RENDITIONS, RECIPE_IMAGE_WORKERS,
+                               RECIPE_IMAGE_QUALITY)
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from .cache import bump_reference_version
+
+logger = logging.getLogger(__name__)
+
+IMAGE_NAME = re.compile(r'^recipes/(?P<digest>[0-9a-f]{64})\.jpg$')
+
+FORMATS = {
+    'jpg': 'JPEG',
+    'webp': 'WEBP',
+}
+
+executor = (
+    ThreadPoolExecutor(
+        max_workers=RECIPE_IMAGE_WORKERS,
+        thread_name_prefix='recipe-images'
+    )
+    if RECIPE_IMAGE_WORKERS else None
+)
+
+
+def rendition_name(image_name, size=None, extension='jpg'):
+    match = IMAGE_NAME.match(image_name or '')
+    if match is None:
+        return image_name
+    if size is None:
+        return f'recipes/{match["digest"]}.{extension}'
+    return f'recipes/{match["digest"]}_{size}.{extension}'
+
+
+def encode(image, format):
+    buffer = io.BytesIO()
+    # Метаданные (EXIF, ICC, комментарии) не передаются в save,
+    # поэтому в итоговые файлы они не попадают.
+    image.save(buffer, format=FORMATS[format], quality=RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def store(name, content):
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+
+
+def build_renditions(data):
+    digest = hashlib.sha256(data).hexdigest()
+    original = f'recipes/{digest}.jpg'
+    if default_storage.exists(original):
+        return original
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source).convert('RGB')
+    for size, width in RECIPE_IMAGE_RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail((width, width))
+        for extension in FORMATS:
+            store(
+                rendition_name(original, size, extension),
+                encode(rendition, extension)
+            )
+    store(rendition_name(original, extension='webp'), encode(image, 'webp'))
+    store(original, encode(image, 'jpg'))
+    return original
+
+
+def process_recipe_image(recipe_id, data):
+    try:
+        Recipe.objects.filter(pk=recipe_id).update(
+            image=build_renditions(data)
+        )
+        bump_reference_version('recipes')
+    except Exception:
+        logger.exception('не удалось обработать изображение рецепта %s',
+                         recipe_id)
+    finally:
+        if executor is not None:
+            connection.close()
+
+
+def schedule_recipe_image(recipe_id, data):
+    if executor is None:
+        process_recipe_image(recipe_id, data)
+    else:
+        executor.submit(process_recipe_image, recipe_id, data)
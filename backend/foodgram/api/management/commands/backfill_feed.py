@@ -0,0 +1,29 @@
+from foodgram.settings import FEED_MAX_FOLLOWS
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from api.feed import backfill
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет хранимые ленты подписок по уже существующим подпискам '
+        'и рецептам. Запускается после миграции, которая добавляет '
+        'таблицу ленты; повторный запуск ничего не дублирует.'
+    )
+
+    def handle(self, *args, **options):
+        user_ids = Follow.objects.order_by().values('user').annotate(
+            follows=Count('pk')
+        ).filter(follows__lte=FEED_MAX_FOLLOWS).values_list('user', flat=True)
+        count = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                backfill(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты заполнены: читателей {count}'
+        ))
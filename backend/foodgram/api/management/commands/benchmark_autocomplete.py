@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+
+from foodgram.settings import INGREDIENT_SEARCH_LIMIT
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.search import ingredient_index
+from recipes.models import Ingredient
+
+
+def search_icontains(query, limit):
+    # Так отвечал прежний SearchFilter: icontains по всей таблице, без
+    # порядка и без ограничения числа результатов.
+    return list(Ingredient.objects.filter(name__icontains=query).values(
+        'id', 'name', 'measurement_unit'
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает автодополнение ингредиентов через индекс в памяти с '
+        'прежним поиском icontains на префиксах названий из текущего '
+        'справочника, как их набирает пользователь.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='количество запросов для каждого способа'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=INGREDIENT_SEARCH_LIMIT,
+            help='количество ингредиентов в ответе индекса'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, function, queries, limit):
+        timings, found = [], 0
+        for query in queries:
+            started = time.perf_counter()
+            found += len(function(query, limit))
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings), found / len(queries)
+
+    def handle(self, *args, **options):
+        if min(options['queries'], options['limit']) < 1:
+            raise CommandError('Параметры должны быть больше 0')
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Справочник ингредиентов пуст')
+        generator = random.Random(options['seed'])
+        queries = []
+        while len(queries) < options['queries']:
+            name = generator.choice(names)
+            queries.extend(
+                name[:length] for length in range(1, min(len(name), 4) + 1)
+            )
+        queries = queries[:options['queries']]
+        started = time.perf_counter()
+        ingredient_index.search('', 1)
+        self.stdout.write(
+            f'Построение индекса: '
+            f'{(time.perf_counter() - started) * 1000:.0f} мс, '
+            f'ингредиентов {len(names)}'
+        )
+        for name, function in (
+            ('Индекс', ingredient_index.search),
+            ('icontains', search_icontains),
+        ):
+            timings, found = self.measure(function, queries, options['limit'])
+            self.stdout.write(
+                f'{name}: медиана {statistics.median(timings):.3f} мс, '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:.3f} мс, '
+                f'в среднем {found:.0f} результатов'
+            )
@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+
+from foodgram.settings import COOKING_RESULTS_LIMIT
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+
+from api.cooking import cooking_index
+from recipes.models import Ingredient, Recipe
+
+
+def match_sql(ingredient_ids, limit, max_missing=None):
+    queryset = Recipe.objects.order_by().annotate(
+        matched=Count('ingredients', filter=Q(
+            ingredients__ingredient_id__in=ingredient_ids
+        )),
+        total=Count('ingredients')
+    ).filter(matched__gt=0).annotate(missing=F('total') - F('matched'))
+    if max_missing is not None:
+        queryset = queryset.filter(missing__lte=max_missing)
+    return list(queryset.order_by('missing', '-matched', '-pk').values_list(
+        'pk', 'matched', 'missing'
+    )[:limit])
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает подбор рецептов по ингредиентам через индекс в памяти '
+        'и через GROUP BY в базе на случайных наборах ингредиентов из '
+        'текущих данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=10,
+            help='размер набора ингредиентов в одном запросе'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=50,
+            help='количество запросов для каждого способа'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=COOKING_RESULTS_LIMIT,
+            help='количество рецептов в ответе'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, function, queries, limit):
+        timings, results = [], []
+        for ingredient_ids in queries:
+            started = time.perf_counter()
+            results.append(function(ingredient_ids, limit))
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings, results
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        self.stdout.write(
+            f'{name}: медиана {statistics.median(timings):.2f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f} мс, '
+            f'максимум {timings[-1]:.2f} мс'
+        )
+
+    def handle(self, *args, **options):
+        if min(options['ingredients'], options['queries'],
+               options['limit']) < 1:
+            raise CommandError('Параметры должны быть больше 0')
+        ingredient_ids = list(Ingredient.objects.filter(
+            amounts__isnull=False
+        ).distinct().values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError('В базе нет рецептов с ингредиентами')
+        generator = random.Random(options['seed'])
+        size = min(options['ingredients'], len(ingredient_ids))
+        queries = [
+            generator.sample(ingredient_ids, size)
+            for _ in range(options['queries'])
+        ]
+        started = time.perf_counter()
+        cooking_index.get()
+        self.stdout.write(
+            f'Построение индекса: '
+            f'{(time.perf_counter() - started) * 1000:.0f} мс, '
+            f'рецептов {Recipe.objects.count()}'
+        )
+        index_timings, index_results = self.measure(
+            cooking_index.match, queries, options['limit']
+        )
+        sql_timings, sql_results = self.measure(
+            match_sql, queries, options['limit']
+        )
+        self.report('Индекс', index_timings)
+        self.report('GROUP BY', sql_timings)
+        if index_results != sql_results:
+            raise CommandError('Результаты индекса и GROUP BY различаются')
+        self.stdout.write(self.style.SUCCESS('Результаты совпадают'))
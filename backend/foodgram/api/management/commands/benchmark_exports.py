@@ -0,0 +1,65 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.renderers import (CSVShoppingListRenderer, PDFShoppingListRenderer,
+                           TextShoppingListRenderer)
+
+RENDERERS = (
+    CSVShoppingListRenderer,
+    TextShoppingListRenderer,
+    PDFShoppingListRenderer,
+)
+
+
+def make_rows(count):
+    for number in range(count):
+        yield f'Ингредиент {number}', number % 1000 + 1, 'г'
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет скорость потоковой выдачи списка покупок в каждом '
+        'формате и пиковую память при сборке документа целиком и по '
+        'частям.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=10000,
+            help='количество строк в списке покупок'
+        )
+
+    def measure(self, consume):
+        started = time.perf_counter()
+        size = consume()
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        consume()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size, elapsed, peak
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        if rows < 1:
+            raise CommandError('--rows должен быть больше 0')
+        for renderer_class in RENDERERS:
+            renderer = renderer_class()
+            for mode, consume in (
+                ('целиком', lambda: len(b''.join(
+                    renderer.stream(list(make_rows(rows)))
+                ))),
+                ('потоком', lambda: sum(
+                    len(chunk) for chunk in renderer.stream(make_rows(rows))
+                )),
+            ):
+                size, elapsed, peak = self.measure(consume)
+                self.stdout.write(
+                    f'{renderer.format} {mode}: {elapsed * 1000:.0f} мс, '
+                    f'{rows / elapsed:.0f} строк/с, {size / 1024:.0f} КБ, '
+                    f'пик памяти {peak / 1024:.0f} КБ'
+                )
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from api.benchmarks import benchmark_data, measure, summary
+from api.filters import RecipeFilter
+from recipes.models import Recipe
+
+PAGE_SIZE = 10
+
+
+def joined(params, user):
+    # Прежний фильтр: JOIN по тегам с DISTINCT и JOIN по избранному и
+    # списку покупок.
+    queryset = Recipe.objects.all()
+    if 'tags' in params:
+        queryset = queryset.filter(tags__slug__in=params['tags']).distinct()
+    for param, lookup in (('is_favorited', 'users_who_favorited'),
+                          ('is_in_shopping_cart', 'users_who_shopped')):
+        if params.get(param) == 1:
+            queryset = queryset.filter(**{lookup: user})
+        elif params.get(param) == 0:
+            queryset = queryset.exclude(**{lookup: user})
+    return queryset
+
+
+def semi_joined(params, user):
+    request = RequestFactory().get('/api/recipes/', params)
+    request.user = user
+    return RecipeFilter(
+        request.GET, queryset=Recipe.objects.all(), request=request
+    ).qs
+
+
+def page(queryset):
+    # Страница API — это COUNT и первые PAGE_SIZE рецептов.
+    queryset = queryset.order_by('-pub_date', '-id')
+    return queryset.count(), list(
+        queryset.values_list('pk', flat=True)[:PAGE_SIZE]
+    )
+
+
+METHODS = (
+    ('JOIN', joined),
+    ('EXISTS', semi_joined),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает фильтрацию рецептов по тегам, избранному и списку '
+        'покупок через JOIN с DISTINCT и через EXISTS. С --recipes замер '
+        'идёт на синтетических данных, которые откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=0,
+            help='сколько синтетических рецептов создать на время замера'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='количество повторов каждого запроса'
+        )
+
+    def handle(self, *args, **options):
+        if options['recipes'] < 0 or options['repeat'] < 1:
+            raise CommandError('Некорректные параметры замера')
+        with benchmark_data(options['recipes']) as (user, slugs):
+            if user is None or len(slugs) < 2:
+                raise CommandError('Нужны пользователь и хотя бы два тега')
+            self.stdout.write(f'Рецептов: {Recipe.objects.count()}')
+            for name, params in (
+                ('теги', {'tags': slugs[:2]}),
+                ('теги и избранное', {'tags': slugs[:2], 'is_favorited': 1}),
+                ('не в списке покупок', {'is_in_shopping_cart': 0}),
+            ):
+                results = {}
+                for method, build in METHODS:
+                    timings, pages = measure(
+                        lambda _: page(build(params, user)),
+                        range(options['repeat'])
+                    )
+                    results[method] = pages[0]
+                    self.stdout.write(f'{name}, {method}: {summary(timings)}')
+                if results['JOIN'] != results['EXISTS']:
+                    raise CommandError(f'{name}: результаты различаются')
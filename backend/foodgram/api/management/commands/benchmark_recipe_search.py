@@ -0,0 +1,86 @@
+import random
+from functools import reduce
+from operator import and_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from api.benchmarks import benchmark_data, measure, phrase, summary
+from recipes.models import Recipe
+
+PAGE_SIZE = 10
+
+
+def ranked(query):
+    queryset = Recipe.objects.search(query).order_by(
+        '-search_rank', '-pub_date', '-id'
+    )
+    return queryset.count(), list(
+        queryset.values_list('pk', flat=True)[:PAGE_SIZE]
+    )
+
+
+def icontains(query):
+    # Наивный поиск: каждое слово запроса ищется подстрокой в названии
+    # или тексте, порядок — по дате публикации.
+    queryset = Recipe.objects.filter(reduce(and_, (
+        Q(name__icontains=term) | Q(text__icontains=term)
+        for term in query.split()
+    ))).order_by('-pub_date', '-id')
+    return queryset.count(), list(
+        queryset.values_list('pk', flat=True)[:PAGE_SIZE]
+    )
+
+
+METHODS = (
+    ('Полнотекстовый поиск', ranked),
+    ('icontains', icontains),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ранжированный полнотекстовый поиск рецептов с '
+        'наивным icontains по названию и тексту на странице API: COUNT и '
+        'первые рецепты. С --recipes замер идёт на синтетических данных, '
+        'которые откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=0,
+            help='сколько синтетических рецептов создать на время замера'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=50,
+            help='количество запросов для каждого способа'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['recipes'] < 0 or options['queries'] < 1:
+            raise CommandError('Некорректные параметры замера')
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                'Без PostgreSQL поиск выполняется в Python, замер '
+                'не отражает работу сервера'
+            ))
+        generator = random.Random(options['seed'])
+        queries = [
+            phrase(generator, generator.randint(1, 2))
+            for _ in range(options['queries'])
+        ]
+        with benchmark_data(options['recipes'], options['seed']):
+            self.stdout.write(f'Рецептов: {Recipe.objects.count()}')
+            for name, function in METHODS:
+                timings, pages = measure(function, queries)
+                found = sum(count for count, _ in pages) / len(pages)
+                self.stdout.write(
+                    f'{name}: {summary(timings)}, '
+                    f'в среднем найдено {found:.0f}'
+                )
@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.units import unit_table
+from recipes.models import Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+def get_queries(user):
+    tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+    queries = {
+        'feed': Recipe.objects.all()[:10],
+        'shopping_list': RecipeIngredient.objects.shopping_list(
+            user, unit_table.get()
+        ),
+    }
+    for name, params in (
+        ('tags', {'tags': tags}),
+        ('is_favorited', {'is_favorited': 1}),
+        ('is_in_shopping_cart', {'is_in_shopping_cart': 1}),
+    ):
+        request = RequestFactory().get('/api/recipes/', params)
+        request.user = user
+        queries[name] = RecipeFilter(
+            request.GET,
+            queryset=Recipe.objects.all(),
+            request=request
+        ).qs[:10]
+    return queries
+
+
+def find_seq_scans(node):
+    if node.get('Node Type') == 'Seq Scan':
+        yield node['Relation Name']
+    for child in node.get('Plans', ()):
+        yield from find_seq_scans(child)
+
+
+def seq_scans(user):
+    scans = {}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # При запрещённом seq scan планировщик выбирает его только
+            # тогда, когда подходящего индекса нет.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset in get_queries(user).items():
+            plan = json.loads(queryset.explain(format='json'))
+            scans[name] = sorted(set(find_seq_scans(plan[0]['Plan'])))
+    return scans
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет планы ключевых запросов (фильтры рецептов, список '
+        'покупок) и завершается с ошибкой, если PostgreSQL выбирает '
+        'последовательное сканирование.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='id пользователя для фильтров избранного и списка покупок'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Проверка планов доступна только в PostgreSQL')
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('В базе нет пользователей')
+        failures = []
+        for name, relations in seq_scans(user).items():
+            if relations:
+                failures.append(f'{name}: {", ".join(relations)}')
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: seq scan по {", ".join(relations)}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+        if failures:
+            raise CommandError(
+                'Последовательное сканирование в запросах: '
+                + '; '.join(failures)
+            )
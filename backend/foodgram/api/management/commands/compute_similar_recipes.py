@@ -0,0 +1,46 @@
+import time
+
+from foodgram.settings import SIMILAR_RECIPES_TOP_K
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.similarity import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты по косинусному сходству наборов '
+        'ингредиентов и тегов. По умолчанию обновляет только изменённые '
+        'рецепты и их соседей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='пересчитать списки для всех рецептов'
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=SIMILAR_RECIPES_TOP_K,
+            help='количество похожих рецептов для каждого рецепта'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='количество строк матрицы в одном умножении'
+        )
+
+    def handle(self, *args, **options):
+        if options['top_k'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--top-k и --batch-size должны быть больше 0')
+        started = time.monotonic()
+        updated = refresh(
+            options['top_k'], options['batch_size'], full=options['full']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты обновлены для {updated} рецептов '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
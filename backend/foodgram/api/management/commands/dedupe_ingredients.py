@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from api.cache import bump_reference_version_on_commit
+from api.cooking import cooking_index
+from recipes.models import Ingredient, RecipeIngredient
+from .dedupe_recipe_ingredients import AMOUNT_MAX
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединяет ингредиенты с одинаковыми названием и единицей '
+        'измерения: рецепты переводятся на ингредиент с наименьшим id, '
+        'повторы удаляются. Запускается перед миграцией, которая '
+        'добавляет ограничение unique_ingredient.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='показать число повторов и откатить транзакцию'
+        )
+
+    def handle(self, *args, **options):
+        # Команда работает до миграции, поэтому трогает только исходные
+        # столбцы ингредиентов и их строк в рецептах.
+        with transaction.atomic():
+            keep_of, first = {}, {}
+            for pk, name, unit in Ingredient.objects.filter(Exists(
+                Ingredient.objects.filter(
+                    name=OuterRef('name'),
+                    measurement_unit=OuterRef('measurement_unit')
+                ).exclude(pk=OuterRef('pk'))
+            )).order_by('pk').values_list('pk', 'name', 'measurement_unit'):
+                keep_of[pk] = first.setdefault((name, unit), pk)
+            duplicates = {pk for pk, keep in keep_of.items() if pk != keep}
+            rows = list(RecipeIngredient.objects.filter(
+                ingredient__in=keep_of
+            ).order_by('pk'))
+            recipe_ids = {
+                row.recipe_id for row in rows
+                if row.ingredient_id in duplicates
+            }
+            # Если рецепт ссылался на несколько повторов одного
+            # ингредиента, строки сливаются, как в
+            # dedupe_recipe_ingredients: остаётся строка с наименьшим id и
+            # суммарным количеством.
+            merged, extra = {}, []
+            for row in rows:
+                if row.recipe_id not in recipe_ids:
+                    continue
+                key = (row.recipe_id, keep_of[row.ingredient_id])
+                if key in merged:
+                    merged[key].amount = min(
+                        (merged[key].amount or 0) + (row.amount or 0),
+                        AMOUNT_MAX
+                    ) or None
+                    extra.append(row.pk)
+                else:
+                    row.ingredient_id = key[1]
+                    merged[key] = row
+            RecipeIngredient.objects.filter(pk__in=extra).delete()
+            RecipeIngredient.objects.bulk_update(
+                merged.values(), ('ingredient', 'amount'), batch_size=1000
+            )
+            Ingredient.objects.filter(pk__in=duplicates).delete()
+            if options['dry_run']:
+                transaction.set_rollback(True)
+            elif duplicates:
+                bump_reference_version_on_commit('ingredients')
+                bump_reference_version_on_commit('recipes')
+                bump_reference_version_on_commit(cooking_index.name)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Найдено" if options["dry_run"] else "Объединено"}: '
+            f'лишних ингредиентов {len(duplicates)}, '
+            f'затронуто рецептов {len(recipe_ids)}'
+        ))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Sum
+
+from api.cache import bump_reference_version_on_commit
+from recipes.models import RecipeIngredient
+
+AMOUNT_MAX = 32767
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединяет повторяющиеся ингредиенты рецепта в одну строку с '
+        'суммарным количеством. Запускается перед миграцией, которая '
+        'добавляет ограничение unique_recipe_ingredient.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='показать число повторов и откатить транзакцию'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            groups = list(
+                RecipeIngredient.objects.order_by().values(
+                    'recipe', 'ingredient'
+                ).annotate(
+                    count=Count('pk'), keep=Min('pk'), total=Sum('amount')
+                ).filter(count__gt=1)
+            )
+            # Остаётся строка с наименьшим id, количество — сумма повторов,
+            # как их и складывал список покупок.
+            RecipeIngredient.objects.bulk_update(
+                [
+                    RecipeIngredient(
+                        pk=group['keep'],
+                        amount=min(group['total'] or 0, AMOUNT_MAX) or None
+                    )
+                    for group in groups
+                ],
+                ('amount',),
+                batch_size=1000
+            )
+            deleted, _ = RecipeIngredient.objects.filter(
+                Exists(RecipeIngredient.objects.filter(
+                    recipe=OuterRef('recipe'),
+                    ingredient=OuterRef('ingredient'),
+                    pk__lt=OuterRef('pk')
+                ))
+            ).delete()
+            if options['dry_run']:
+                transaction.set_rollback(True)
+            elif deleted:
+                bump_reference_version_on_commit('recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Найдено" if options["dry_run"] else "Объединено"}: '
+            f'{len(groups)} пар рецепт-ингредиент, лишних строк {deleted}'
+        ))
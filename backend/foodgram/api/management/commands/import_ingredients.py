@@ -1,19 +1,125 @@
 import csv
+import itertools
+import json
+import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_reference_version
 from recipes.models import Ingredient
 
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        yield row['name'], row['measurement_unit']
+
+
+def read_json(file):
+    # Массив объектов разбирается по одному элементу, поэтому в памяти
+    # держится только текущий фрагмент файла, а не весь каталог.
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('JSON должен содержать массив')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield row['name'], row['measurement_unit']
+        if not chunk:
+            raise CommandError('Файл JSON обрывается до конца массива')
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
 
 class Command(BaseCommand):
-    data_dir = '/app/data/'
-    filename = 'ingredients.csv'
+    help = (
+        'Загружает ингредиенты из CSV или JSON пачками; уже существующие '
+        'пары (название, единица измерения) пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='/app/data/ingredients.csv',
+            help='файл ingredients.csv или ingredients.json'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='количество строк в одном INSERT'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='выполнить загрузку и откатить транзакцию'
+        )
 
     def handle(self, *args, **options) -> None:
-        ingredients = []
-        with open((self.data_dir + self.filename), encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                ingredient = Ingredient(**row)
-                ingredients.append(ingredient)
-            Ingredient.objects.bulk_create(ingredients)
+        path, batch_size = options['path'], options['batch_size']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if batch_size < 1:
+            raise CommandError('Размер пачки должен быть положительным')
+        started = time.monotonic()
+        total = 0
+        try:
+            with open(path, encoding='utf-8') as file:
+                with transaction.atomic():
+                    before = Ingredient.objects.count()
+                    rows = reader(file)
+                    while batch := list(itertools.islice(rows, batch_size)):
+                        Ingredient.objects.bulk_create(
+                            [
+                                Ingredient(name=name, measurement_unit=unit)
+                                for name, unit in batch
+                            ],
+                            ignore_conflicts=True
+                        )
+                        total += len(batch)
+                        self.report(total, started)
+                    created = Ingredient.objects.count() - before
+                    if options['dry_run']:
+                        transaction.set_rollback(True)
+                    else:
+                        transaction.on_commit(
+                            lambda: bump_reference_version('ingredients')
+                        )
+        except (OSError, KeyError, TypeError, ValueError) as err:
+            raise CommandError(f'Не удалось загрузить {path}: {err!r}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if options["dry_run"] else "Загружено"}: '
+            f'{total} строк, новых ингредиентов {created}, '
+            f'{elapsed:.1f} с ({total / max(elapsed, 1e-6):.0f} строк/с)'
+        ))
+
+    def report(self, total, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{total} строк, {total / max(elapsed, 1e-6):.0f} строк/с'
+        )
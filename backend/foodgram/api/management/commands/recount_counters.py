@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_reference_version_on_commit
+from api.relations import count_of
+from recipes.models import Recipe
+from users.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики избранного, списков покупок, подписчиков '
+        'и рецептов по фактическим данным.'
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.update(
+            favorites_count=count_of(
+                User.favorite_recipes.through.objects, 'recipe'
+            ),
+            in_carts_count=count_of(
+                User.shopping_cart.through.objects, 'recipe'
+            )
+        )
+        users = User.objects.update(
+            followers_count=count_of(Follow.objects, 'following'),
+            recipes_count=count_of(Recipe.objects, 'author')
+        )
+        bump_reference_version_on_commit('recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: рецептов {recipes}, '
+            f'пользователей {users}'
+        ))
@@ -0,0 +1,136 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class FeedPagination(LimitOffsetPagination):
+    page_query_param = 'page'
+    cursor_query_param = 'cursor'
+    default_cursor_fields = ('-pk',)
+    invalid_page_message = 'Некорректный номер страницы.'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page = None
+        self.cursor_mode = self.use_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.fields = getattr(
+            view, 'get_cursor_fields', lambda: self.default_cursor_fields
+        )()
+        queryset = queryset.order_by(*self.fields)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param)
+        )
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        results = list(queryset[:self.limit + 1])
+        self.next_position = None
+        if len(results) > self.limit:
+            results = results[:self.limit]
+            self.next_position = [
+                getattr(results[-1], field.lstrip('-'))
+                for field in self.fields
+            ]
+        return results
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def after(self, position):
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(self.fields[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(
+            self.fields
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position, default=str).encode()
+        ).decode()
+
+    def get_offset(self, request):
+        if self.page_query_param not in request.query_params:
+            return super().get_offset(request)
+        try:
+            self.page = int(request.query_params[self.page_query_param])
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if self.page < 1:
+            raise NotFound(self.invalid_page_message)
+        return (self.page - 1) * self.limit
+
+    def get_next_link(self):
+        if self.cursor_mode:
+            if self.next_position is None:
+                return None
+            return replace_query_param(
+                self.request.build_absolute_uri(),
+                self.cursor_query_param,
+                self.encode_cursor(self.next_position)
+            )
+        if self.page is None:
+            return super().get_next_link()
+        if self.offset + self.limit >= self.count:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param,
+            self.page + 1
+        )
+
+    def get_previous_link(self):
+        if self.cursor_mode:
+            return None
+        if self.page is None:
+            return super().get_previous_link()
+        if self.page == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page - 1)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data)
+        ]))
+
+
+class KeysetPagination(FeedPagination):
+    def use_cursor(self, request):
+        return True
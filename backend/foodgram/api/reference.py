@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import namedtuple
+
+from foodgram.settings import REFERENCE_DATA_TTL
+
+from recipes.models import Ingredient, Tag
+from .cache import reference_version
+
+Catalog = namedtuple('Catalog', ('version', 'loaded', 'items', 'by_id'))
+
+
+class ReferenceData:
+    def __init__(self, name, model, fields, sort_key=None):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.sort_key = sort_key
+        self.catalog = None
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def is_fresh(self, catalog, version):
+        return (
+            catalog is not None
+            and catalog.version == version
+            and time.monotonic() - catalog.loaded < REFERENCE_DATA_TTL
+        )
+
+    def get(self):
+        version = reference_version(self.name)
+        catalog = self.catalog
+        if self.is_fresh(catalog, version):
+            return catalog
+        # Пока один поток перечитывает справочник, остальные отдают
+        # предыдущую версию, а не идут в базу все одновременно.
+        if not self.lock.acquire(blocking=catalog is None):
+            return catalog
+        try:
+            if not self.is_fresh(self.catalog, version):
+                items = tuple(sorted(
+                    self.model.objects.values(*self.fields),
+                    key=self.sort_key or (lambda item: item['id'])
+                ))
+                self.catalog = Catalog(
+                    version,
+                    time.monotonic(),
+                    items,
+                    {item['id']: item for item in items}
+                )
+            return self.catalog
+        finally:
+            self.lock.release()
+
+    def missing(self, ids):
+        by_id = self.get().by_id
+        missing = {pk for pk in ids if pk not in by_id}
+        if missing:
+            # Справочник мог измениться в другом процессе, если кеш
+            # не общий: сверяемся с базой и перечитываем его.
+            found = set(self.model.objects.filter(
+                pk__in=missing
+            ).values_list('pk', flat=True))
+            if found:
+                self.catalog = None
+            missing -= found
+        return missing
+
+
+tags = ReferenceData('tags', Tag, ('id', 'name', 'color', 'slug'))
+ingredients = ReferenceData(
+    'ingredients',
+    Ingredient,
+    ('id', 'name', 'measurement_unit'),
+    sort_key=lambda item: (item['name'].lower(), item['id'])
+)
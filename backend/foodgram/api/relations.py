@@ -0,0 +1,70 @@
+from django.db import connection
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def link_columns(through, source, target):
+    quote = connection.ops.quote_name
+    source_field = through._meta.get_field(source)
+    target_field = through._meta.get_field(target)
+    target_model = target_field.related_model
+    return (
+        quote(through._meta.db_table),
+        quote(source_field.column),
+        quote(target_field.column),
+        quote(target_model._meta.db_table),
+        quote(target_model._meta.pk.column),
+    )
+
+
+def add_links(through, source, target, source_id, target_ids):
+    # Одна вставка вида INSERT ... SELECT ... ON CONFLICT DO NOTHING:
+    # несуществующие объекты отсекает SELECT, уже существующие связи —
+    # уникальный индекс, а RETURNING сообщает, какие строки добавлены.
+    if not target_ids:
+        return set()
+    table, source_column, target_column, target_table, target_pk = (
+        link_columns(through, source, target)
+    )
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({source_column}, {target_column}) '
+            f'SELECT %s, {target_pk} FROM {target_table} '
+            f'WHERE {target_pk} IN ({placeholders}) '
+            f'ON CONFLICT DO NOTHING RETURNING {target_column}',
+            [source_id, *target_ids]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def remove_links(through, source, target, source_id, target_ids=None,
+                 keep=()):
+    # Без target_ids удаляются все связи source_id, кроме перечисленных
+    # в keep: так одним DELETE очищается или заменяется весь набор.
+    if target_ids is not None and not target_ids:
+        return set()
+    table, source_column, target_column, _, _ = (
+        link_columns(through, source, target)
+    )
+    sql = f'DELETE FROM {table} WHERE {source_column} = %s'
+    params = [source_id]
+    if target_ids is not None:
+        placeholders = ', '.join(['%s'] * len(target_ids))
+        sql += f' AND {target_column} IN ({placeholders})'
+        params.extend(target_ids)
+    if keep:
+        placeholders = ', '.join(['%s'] * len(keep))
+        sql += f' AND {target_column} NOT IN ({placeholders})'
+        params.extend(keep)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {target_column}', params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def count_of(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), Value(0))
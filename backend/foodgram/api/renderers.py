@@ -1,26 +1,109 @@
-import io
+import csv
+import tempfile
+
+from foodgram.settings import SHOPPING_LIST_PDF_FONT
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+from reportlab.pdfgen import canvas
 from rest_framework import renderers
 
-SHOPPING_CART_HEADERS = ['amount', 'measurement_unit']
+SHOPPING_CART_HEADERS = ('Название', 'Количество', 'Единица измерения')
+
+CHUNK_SIZE = 64 * 1024
+
 
+class Echo:
+    def write(self, value):
+        return value
 
-class TextDataRenderer(renderers.BaseRenderer):
 
-    media_type = "text/plain"
-    format = "txt"
+class ShoppingListRenderer(renderers.BaseRenderer):
+    # По умолчанию список отдаётся строками текста; форматы со своей
+    # разметкой переопределяют stream.
+    charset = 'utf-8'
+    title = 'Список покупок'
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return b''.join(self.stream_error(str(data.get('detail', data))))
+        return b''.join(self.stream(data))
+
+    def lines(self, rows):
+        for name, amount, measurement_unit in rows:
+            yield f'• {name} ({measurement_unit}) — {amount}'
+
+    def stream(self, rows):
+        yield f'{self.title}\n\n'.encode(self.charset)
+        for line in self.lines(rows):
+            yield f'{line}\n'.encode(self.charset)
+
+    def stream_error(self, message):
+        yield message.encode(self.charset)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(SHOPPING_CART_HEADERS).encode(self.charset)
+        for row in rows:
+            yield writer.writerow(row).encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    def get_font(self):
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        try:
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, SHOPPING_LIST_PDF_FONT)
+            )
+        except (OSError, TTFError):
+            return 'Helvetica'
+        return self.font_name
 
-        text_buffer = io.StringIO()
-        text_buffer.write(
-            ' '.join(header for header in SHOPPING_CART_HEADERS) + '\n')
+    def stream(self, rows):
+        return self.stream_lines(self.lines(rows))
 
-        for ingredient in data:
-            values = []
-            name = ingredient['ingredient']
-            amount = ingredient['amount']
-            values.append(name)
-            values.append(amount)
-            text_buffer.write(' '.join(str(value) for value in values) + '\n')
+    def stream_error(self, message):
+        return self.stream_lines((message,))
 
-        return text_buffer.getvalue()
+    def stream_lines(self, lines):
+        # PDF нельзя отдавать до записи таблицы ссылок в конце файла,
+        # поэтому документ собирается во временном файле, который
+        # переходит на диск при превышении CHUNK_SIZE.
+        font = self.get_font()
+        with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE) as buffer:
+            pdf = canvas.Canvas(buffer, pagesize=A4)
+            height = A4[1]
+            y = height - self.margin
+            pdf.setFont(font, self.font_size)
+            pdf.drawString(self.margin, y, self.title)
+            for line in lines:
+                y -= self.line_height
+                if y < self.margin:
+                    pdf.showPage()
+                    pdf.setFont(font, self.font_size)
+                    y = height - self.margin
+                pdf.drawString(self.margin, y, line)
+            pdf.save()
+            buffer.seek(0)
+            while chunk := buffer.read(CHUNK_SIZE):
+                yield chunk
@@ -0,0 +1,43 @@
+from bisect import bisect_left
+
+from .reference import ingredients
+
+
+class IngredientIndex:
+    def __init__(self, reference):
+        self.reference = reference
+        self.snapshot = (None, ())
+
+    def get_names(self, catalog):
+        if self.snapshot[0] is not catalog:
+            self.snapshot = (
+                catalog,
+                tuple(item['name'].lower() for item in catalog.items)
+            )
+        return self.snapshot[1]
+
+    def search(self, query, limit):
+        catalog = self.reference.get()
+        names, items = self.get_names(catalog), catalog.items
+        query = query.strip().lower()
+        found = []
+        position = bisect_left(names, query)
+        while (
+            position < len(names)
+            and len(found) < limit
+            and names[position].startswith(query)
+        ):
+            found.append(position)
+            position += 1
+        if len(found) < limit:
+            found.extend(
+                position for _, position in sorted(
+                    (name.find(query), position)
+                    for position, name in enumerate(names)
+                    if query in name and not name.startswith(query)
+                )[:limit - len(found)]
+            )
+        return [items[position] for position in found]
+
+
+ingredient_index = IngredientIndex(ingredients)
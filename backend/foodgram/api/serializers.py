@@ -1,14 +1,76 @@
-from foodgram.settings import CSRF_TRUSTED_ORIGINS
+import base64
+import binascii
+import io
+from collections import Counter
+
+from foodgram.settings import (COOKING_RESULTS_LIMIT, COOKING_RESULTS_MAX,
+                               CSRF_TRUSTED_ORIGINS, RECIPE_IMAGE_MAX_SIZE,
+                               RECIPE_IMAGE_RENDITIONS, RECIPES_BATCH_MAX,
+                               RECIPES_LIMIT_DEFAULT, RECIPES_LIMIT_MAX)
 
 from django.contrib.auth.hashers import make_password
-from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
+from django.db import transaction
 
 from rest_framework import serializers
 
-from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, UnidentifiedImageError
 
 from recipes.models import Ingredient, Recipe, Tag, RecipeIngredient
 from users.models import User, Follow
+from .cache import invalidate_shopping_list
+from .cooking import cooking_index
+from .images import rendition_name, schedule_recipe_image
+from . import reference
+
+
+def build_image_url(request, image, size):
+    if not image:
+        return None
+    size = request.query_params.get('image_size', size)
+    if size not in RECIPE_IMAGE_RENDITIONS:
+        size = None
+    extension = (
+        'webp' if request.query_params.get('image_format') == 'webp'
+        else 'jpg'
+    )
+    image_url = default_storage.url(
+        rendition_name(image.name, size, extension)
+    )
+    return request.build_absolute_uri(image_url).replace(
+        'http://backend:8000', CSRF_TRUSTED_ORIGINS[0]
+    )
+
+
+class Base64ImageBytesField(serializers.Field):
+    default_error_messages = {
+        'invalid': 'загрузите корректное изображение в формате base64',
+        'too_large': 'размер изображения не должен превышать {max_size} байт',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        if ';base64,' in data:
+            data = data.split(';base64,', 1)[1]
+        try:
+            decoded = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            self.fail('invalid')
+        if len(decoded) > RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=RECIPE_IMAGE_MAX_SIZE)
+        # Image.open читает только заголовок файла, само изображение
+        # декодируется позже, вне запроса.
+        try:
+            Image.open(io.BytesIO(decoded)).close()
+        except (UnidentifiedImageError, OSError):
+            self.fail('invalid')
+        return decoded
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return build_image_url(self.context['request'], value, None)
 
 
 class NestedRecipeSerializer(serializers.ModelSerializer):
@@ -24,17 +86,61 @@ class NestedRecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_image(self, obj):
-        request = self.context['request']
-        image_url = obj.image.url
-        return request.build_absolute_uri(image_url).replace(
-            'http://backend:8000', CSRF_TRUSTED_ORIGINS[0]
-        )
+        return build_image_url(self.context['request'], obj.image, 'small')
+
+
+def get_recipes_limit(request):
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return RECIPES_LIMIT_DEFAULT
+    return min(max(limit, 0), RECIPES_LIMIT_MAX)
+
 
+def get_requested_fields(request, available):
+    # ?fields=id,name,tags сужает ответ до перечисленных полей; без
+    # параметра или без известных полей в нём возвращаются все поля.
+    requested = {
+        name.strip()
+        for name in request.query_params.get('fields', '').split(',')
+    } & set(available)
+    return requested or set(available)
 
-class UserSerializer(serializers.ModelSerializer):
+
+class AuthorSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
-    recipes = NestedRecipeSerializer(many=True, read_only=True)
+    class Meta:
+        model = User
+        fields = (
+            'email',
+            'id',
+            'username',
+            'first_name',
+            'last_name',
+            'is_subscribed'
+        )
+
+    def get_is_subscribed(self, obj):
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        # Подписки пользователя загружаются один раз на весь ответ:
+        # контекст общий для всех вложенных сериализаторов.
+        if 'followed_ids' not in self.context:
+            self.context['followed_ids'] = set(
+                Follow.objects.filter(user=user).values_list(
+                    'following_id',
+                    flat=True
+                )
+            )
+        return obj.pk in self.context['followed_ids']
+
+
+class UserSerializer(AuthorSerializer):
+    recipes = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -46,7 +152,13 @@ class UserSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'password',
-            'recipes'
+            'recipes',
+            'recipes_count',
+            'followers_count'
+        )
+        read_only_fields = (
+            'recipes_count',
+            'followers_count'
         )
         extra_kwargs = {
             'password': {'write_only': True}
@@ -55,13 +167,13 @@ class UserSerializer(serializers.ModelSerializer):
     def validate_password(self, value):
         return make_password(value)
 
-    def get_is_subscribed(self, obj):
-        if self.context['request'].user.is_authenticated:
-            return Follow.objects.filter(
-                user=self.context['request'].user,
-                following=obj
-            ).exists()
-        return False
+    def get_recipes(self, obj):
+        limit = get_recipes_limit(self.context['request'])
+        return NestedRecipeSerializer(
+            obj.recipes.all()[:limit],
+            many=True,
+            context=self.context
+        ).data
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -74,18 +186,6 @@ class IngredientSerializer(serializers.ModelSerializer):
         )
 
 
-class NestedIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.IntegerField(min_value=1)
-
-    class Meta:
-        model = Ingredient
-        fields = (
-            'id',
-            'name',
-            'measurement_unit'
-        )
-
-
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -98,24 +198,21 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientReadSerializer(serializers.ModelSerializer):
-    ingredient = NestedIngredientSerializer()
+    id = serializers.ReadOnlyField(source='ingredient.pk')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
 
     class Meta:
         model = RecipeIngredient
         fields = (
             'id',
-            'ingredient'
+            'name',
+            'measurement_unit',
+            'amount'
         )
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        del ret['ingredient']
-        ret['id'] = instance.ingredient.pk
-        ret['name'] = instance.ingredient.name
-        ret['measurement_unit'] = instance.ingredient.measurement_unit
-        ret['amount'] = instance.amount
-        return ret
-
 
 class RecipeIngredientWriteSerializer(serializers.Serializer):
     id = serializers.IntegerField(min_value=1)
@@ -139,6 +236,75 @@ class RecipeFavoritesShoppingCartSerializer(serializers.ModelSerializer):
         )
 
 
+class CookableRecipeSerializer(RecipeFavoritesShoppingCartSerializer):
+    matched_count = serializers.ReadOnlyField()
+    missing_count = serializers.ReadOnlyField()
+
+    class Meta(RecipeFavoritesShoppingCartSerializer.Meta):
+        fields = RecipeFavoritesShoppingCartSerializer.Meta.fields + (
+            'matched_count',
+            'missing_count'
+        )
+
+
+class SimilarRecipeSerializer(RecipeFavoritesShoppingCartSerializer):
+    score = serializers.ReadOnlyField()
+
+    class Meta(RecipeFavoritesShoppingCartSerializer.Meta):
+        fields = RecipeFavoritesShoppingCartSerializer.Meta.fields + (
+            'score',
+        )
+
+
+class CookQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPES_BATCH_MAX
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=COOKING_RESULTS_MAX,
+        default=COOKING_RESULTS_LIMIT
+    )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPES_BATCH_MAX
+    )
+
+    def validate_recipes(self, value):
+        return sorted(set(value))
+
+
+class RecipeIdsReplaceSerializer(RecipeIdsSerializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=RECIPES_BATCH_MAX
+    )
+
+
+class ReferencePrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    def __init__(self, reference, **kwargs):
+        self.reference = reference
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if self.reference.missing((pk,)):
+            self.fail('does_not_exist', pk_value=data)
+        return pk
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
 
@@ -146,7 +312,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
     tags = TagSerializer(many=True)
     ingredients = RecipeIngredientReadSerializer(many=True)
-    author = UserSerializer(
+    author = AuthorSerializer(
         read_only=True,
     )
     image = serializers.SerializerMethodField()
@@ -164,26 +330,43 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'image',
             'text',
             'cooking_time',
-
+            'favorites_count'
         )
         depth = 1
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        requested = get_requested_fields(request, self.Meta.fields)
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
+
     def get_image(self, obj):
-        request = self.context['request']
-        image_url = obj.image.url
-        return request.build_absolute_uri(image_url).replace(
-            'http://backend:8000', CSRF_TRUSTED_ORIGINS[0]
+        view = self.context.get('view')
+        return build_image_url(
+            self.context['request'],
+            obj.image,
+            'large' if getattr(view, 'action', None) == 'retrieve'
+            else 'medium'
         )
 
     def get_is_favorited(self, obj):
-        if self.context['request'].user.is_authenticated:
-            return obj in self.context['request'].user.favorite_recipes.all()
-        return False
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return user.favorite_recipes.filter(pk=obj.pk).exists()
 
     def get_is_in_shopping_cart(self, obj):
-        if self.context['request'].user.is_authenticated:
-            return obj in self.context['request'].user.shopping_cart.all()
-        return False
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return user.shopping_cart.filter(pk=obj.pk).exists()
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -192,15 +375,16 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     is_in_shopping_cart = serializers.SerializerMethodField()
 
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = ReferencePrimaryKeyField(
         queryset=Tag.objects.all(),
+        reference=reference.tags,
         many=True
     )
     ingredients = RecipeIngredientWriteSerializer(many=True)
-    author = UserSerializer(
+    author = AuthorSerializer(
         read_only=True,
     )
-    image = Base64ImageField(
+    image = Base64ImageBytesField(
         required=False,
         allow_null=True
     )
@@ -222,57 +406,132 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
         depth = 1
 
+    def validate_ingredients(self, value):
+        ids = Counter(ingredient['id'] for ingredient in value)
+        duplicates = {pk for pk, count in ids.items() if count > 1}
+        if duplicates:
+            raise serializers.ValidationError(
+                'ингредиенты указаны несколько раз: '
+                + ', '.join(str(pk) for pk in sorted(duplicates))
+            )
+        missing = reference.ingredients.missing(ids)
+        if missing:
+            raise serializers.ValidationError(
+                'ингредиенты не найдены: '
+                + ', '.join(str(pk) for pk in sorted(missing))
+            )
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        image = validated_data.pop('image', None)
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        objs = []
-        for ingredient_data in ingredients_data:
-            id = ingredient_data.pop('id')
-            amount = ingredient_data.pop('amount')
-            obj = RecipeIngredient(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
-                ingredient=get_object_or_404(Ingredient, pk=id),
-                amount=amount
+                ingredient_id=ingredient_data['id'],
+                amount=ingredient_data['amount']
+            )
+            for ingredient_data in ingredients_data
+        )
+        ingredient_ids = [data['id'] for data in ingredients_data]
+        transaction.on_commit(
+            lambda: cooking_index.update_recipe(recipe.pk, (), ingredient_ids)
+        )
+        if image is not None:
+            transaction.on_commit(
+                lambda: schedule_recipe_image(recipe.pk, image)
             )
-            objs.append(obj)
-        RecipeIngredient.objects.bulk_create(objs)
         return recipe
 
+    def set_ingredients(self, instance, ingredients_data):
+        amounts = {
+            ingredient_data['id']: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+        current = {
+            obj.ingredient_id: obj for obj in instance.ingredients.all()
+        }
+        removed = current.keys() - amounts.keys()
+        added = [
+            RecipeIngredient(recipe=instance, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items()
+            if pk not in current
+        ]
+        changed = []
+        for pk, obj in current.items():
+            if pk in amounts and obj.amount != amounts[pk]:
+                obj.amount = amounts[pk]
+                changed.append(obj)
+        if removed:
+            instance.ingredients.filter(ingredient_id__in=removed).delete()
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        if removed or added:
+            old_ids, new_ids = set(current), set(amounts)
+            transaction.on_commit(lambda: cooking_index.update_recipe(
+                instance.pk, old_ids, new_ids
+            ))
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        return bool(removed or added or changed)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        if 'ingredients' in validated_data.keys():
-            instance.ingredients.all().delete()
+        update_fields = ['name', 'text', 'cooking_time']
+        similar_changed = False
+        if 'ingredients' in validated_data:
             ingredients_data = validated_data.pop('ingredients')
-            objs = []
-            for ingredient_data in ingredients_data:
-                id = ingredient_data.pop('id')
-                amount = ingredient_data.pop('amount')
-                obj, _ = RecipeIngredient.objects.get_or_create(
-                    recipe=instance,
-                    ingredient=get_object_or_404(Ingredient, pk=id),
-                    amount=amount
+            if self.set_ingredients(instance, ingredients_data):
+                user_ids = list(
+                    instance.users_who_shopped.values_list('pk', flat=True)
                 )
-                objs.append(obj)
-            RecipeIngredient.objects.bulk_create(objs, ignore_conflicts=True)
-        tags = validated_data.get('tags', instance.tags)
-        instance.tags.set(tags)
+                transaction.on_commit(
+                    lambda: invalidate_shopping_list(*user_ids)
+                )
+                similar_changed = True
+        if 'tags' in validated_data:
+            instance.tags.set(validated_data.pop('tags'))
+            similar_changed = True
+        if similar_changed:
+            # Список похожих рецептов пересчитает compute_similar_recipes.
+            Recipe.objects.filter(pk=instance.pk).mark_similar_stale()
+            instance.similar_stale = True
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
-        instance.image = validated_data.get('image', instance.image)
+        if 'image' in validated_data:
+            image = validated_data.pop('image')
+            if image is None:
+                instance.image = None
+                update_fields.append('image')
+            else:
+                transaction.on_commit(
+                    lambda: schedule_recipe_image(instance.pk, image)
+                )
         instance.cooking_time = validated_data.get(
             'cooking_time',
             instance.cooking_time
         )
-        instance.save()
+        # Изображение сохраняет фоновая обработка, поэтому поле image
+        # записывается только при явном удалении картинки.
+        instance.save(update_fields=update_fields)
         return instance
 
     def get_is_favorited(self, obj):
-        if self.context['request'].user.is_authenticated:
-            return obj in self.context['request'].user.favorite_recipes.all()
-        return False
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return user.favorite_recipes.filter(pk=obj.pk).exists()
 
     def get_is_in_shopping_cart(self, obj):
-        if self.context['request'].user.is_authenticated:
-            return obj in self.context['request'].user.shopping_cart.all()
-        return False
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return user.shopping_cart.filter(pk=obj.pk).exists()
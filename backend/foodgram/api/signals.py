@@ -0,0 +1,237 @@
+from foodgram.settings import RECIPE_SEARCH_CONFIG
+
+from django.db import connection
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_delete)
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import Follow, User
+from .authentication import token_cache
+from .cache import (bump_recipe_counters_on_commit, bump_reference_version,
+                    bump_reference_version_on_commit)
+from .feed import fan_out, followed, unfollowed
+from .relations import count_of
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_reference_version('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_reference_version('tags')
+
+
+# Ингредиенты рецепта пишутся bulk-операциями без сигналов, но сериализатор
+# всегда сохраняет и сам рецепт, поэтому post_save здесь достаточно.
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes(**kwargs):
+    bump_reference_version_on_commit('recipes')
+
+
+RECIPE_COUNTERS = {
+    User.favorite_recipes.through: 'favorites_count',
+    User.shopping_cart.through: 'in_carts_count',
+}
+
+
+def recount_recipes(through, recipe_ids):
+    Recipe.objects.filter(pk__in=recipe_ids).update(**{
+        RECIPE_COUNTERS[through]: count_of(through.objects, 'recipe')
+    })
+    bump_recipe_counters_on_commit(recipe_ids)
+
+
+def remember_recipes(user, throughs):
+    user._counted_recipe_ids = {
+        through: list(through.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        ))
+        for through in throughs
+    }
+
+
+def recount_remembered(user):
+    for through, recipe_ids in user.__dict__.pop(
+        '_counted_recipe_ids', {}
+    ).items():
+        recount_recipes(through, recipe_ids)
+
+
+# Представления API меняют связи SQL-запросами и сами сдвигают счётчики,
+# а записи из админки и через ORM доходят сюда: после них счётчики
+# затронутых строк пересчитываются по фактическим связям.
+@receiver(m2m_changed, sender=User.favorite_recipes.through)
+@receiver(m2m_changed, sender=User.shopping_cart.through)
+def recount_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recount_recipes(sender, [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        recount_recipes(sender, pk_set)
+    elif action == 'pre_clear':
+        remember_recipes(instance, [sender])
+    elif action == 'post_clear':
+        recount_remembered(instance)
+
+
+# Строки неявных таблиц связей удаляются каскадом без сигналов, поэтому
+# рецепты удаляемого пользователя запоминаются заранее.
+@receiver(pre_delete, sender=User)
+def remember_user_relations(instance, **kwargs):
+    remember_recipes(instance, RECIPE_COUNTERS)
+
+
+@receiver(post_delete, sender=User)
+def recount_user_relations(instance, **kwargs):
+    recount_remembered(instance)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def recount_followers(instance, **kwargs):
+    User.objects.filter(pk=instance.following_id).update(
+        followers_count=count_of(Follow.objects, 'following')
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recount_author_recipes(instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=count_of(Recipe.objects, 'author')
+    )
+
+
+# Ленты подписок, как и счётчики, получают рецепты и подписки из
+# админки и ORM; подписки через API ленты обновляют сами.
+@receiver(post_save, sender=Recipe)
+def add_to_feeds(instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_feed(instance, created, **kwargs):
+    if created:
+        followed(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_feed(instance, origin, **kwargs):
+    # При удалении пользователя его лента и рецепты удаляются каскадом.
+    if not isinstance(origin, User):
+        unfollowed(instance.user_id, instance.following_id)
+
+
+# Выход через djoser удаляет токен, а смена пароля и деактивация
+# сохраняют пользователя; в обоих случаях кэш токена сбрасывается.
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, **kwargs):
+    if created:
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ))
+    if keys:
+        token_cache.delete(*keys)
+
+
+POSTGRES_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS users_user_favorite_recipes_recipe_user '
+    'ON users_user_favorite_recipes (recipe_id, user_id)',
+    'CREATE INDEX IF NOT EXISTS users_user_shopping_cart_recipe_user '
+    'ON users_user_shopping_cart (recipe_id, user_id)',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe '
+    'ON recipes_recipe_tags (tag_id, recipe_id)',
+)
+
+POSTGRES_SEARCH = (
+    f"""
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector(
+        recipe_id bigint, name text, body text
+    ) RETURNS tsvector AS $$
+        SELECT
+            setweight(to_tsvector('{RECIPE_SEARCH_CONFIG}',
+                                  coalesce(name, '')), 'A')
+            || setweight(to_tsvector('{RECIPE_SEARCH_CONFIG}',
+                                     coalesce(body, '')), 'B')
+            || setweight(to_tsvector('{RECIPE_SEARCH_CONFIG}', coalesce((
+                SELECT string_agg(i.name, ' ')
+                FROM recipes_recipeingredient ri
+                JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+                WHERE ri.recipe_id = $1
+            ), '')), 'C')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_trigger()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := recipes_recipe_search_vector(
+            NEW.id, NEW.name, NEW.text
+        );
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipeingredient_search_trigger()
+    RETURNS trigger AS $$
+    DECLARE
+        changed_recipe_id bigint;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            changed_recipe_id := OLD.recipe_id;
+        ELSE
+            changed_recipe_id := NEW.recipe_id;
+        END IF;
+        UPDATE recipes_recipe
+        SET search_vector = recipes_recipe_search_vector(id, name, text)
+        WHERE id = changed_recipe_id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    'DROP TRIGGER IF EXISTS recipes_recipe_search ON recipes_recipe',
+    'CREATE TRIGGER recipes_recipe_search '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_trigger()',
+    'DROP TRIGGER IF EXISTS recipes_recipeingredient_search '
+    'ON recipes_recipeingredient',
+    'CREATE TRIGGER recipes_recipeingredient_search '
+    'AFTER INSERT OR UPDATE OR DELETE ON recipes_recipeingredient '
+    'FOR EACH ROW EXECUTE FUNCTION recipes_recipeingredient_search_trigger()',
+    'UPDATE recipes_recipe '
+    'SET search_vector = recipes_recipe_search_vector(id, name, text) '
+    'WHERE search_vector IS NULL',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+
+
+@receiver(post_migrate)
+def create_postgres_indexes(app_config, **kwargs):
+    # Индексы на неявных таблицах связей и функциональные индексы
+    # нельзя описать в Meta моделей, поэтому они создаются здесь.
+    if app_config.name != 'users' or connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for statement in POSTGRES_INDEXES + POSTGRES_SEARCH:
+            cursor.execute(statement)
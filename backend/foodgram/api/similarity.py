@@ -0,0 +1,158 @@
+import numpy as np
+from scipy import sparse
+
+from foodgram.settings import SIMILAR_RECIPES_TAG_WEIGHT
+
+from django.db import connection, transaction
+
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+from .cache import bump_reference_version_on_commit
+
+
+def read_features():
+    versions = dict(
+        Recipe.objects.order_by('pk').values_list('pk', 'similar_version')
+    )
+    recipe_ids = list(versions)
+    positions = {pk: row for row, pk in enumerate(recipe_ids)}
+    columns, rows, cols, data = {}, [], [], []
+    for kind, queryset, weight in (
+        ('ingredient', RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ), 1.0),
+        ('tag', Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ), SIMILAR_RECIPES_TAG_WEIGHT),
+    ):
+        for recipe_id, feature_id in queryset.iterator(chunk_size=10000):
+            # Рецепт, созданный после первого запроса, попадёт в матрицу
+            # при следующем пересчёте: он остаётся помеченным similar_stale.
+            row = positions.get(recipe_id)
+            if row is None:
+                continue
+            rows.append(row)
+            cols.append(columns.setdefault((kind, feature_id), len(columns)))
+            data.append(weight)
+    return recipe_ids, positions, versions, columns, (data, (rows, cols))
+
+
+def load_matrix():
+    # Строка матрицы — рецепт, столбец — ингредиент или тег. Строки
+    # нормированы, поэтому произведение матриц сразу даёт косинусы.
+    consistent = (
+        connection.vendor == 'postgresql' and not connection.in_atomic_block
+    )
+    with transaction.atomic():
+        if consistent:
+            # Все запросы читают один снимок базы.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ'
+                )
+        recipe_ids, positions, versions, columns, entries = read_features()
+    matrix = sparse.csr_matrix(
+        entries,
+        shape=(len(recipe_ids), max(len(columns), 1)),
+        dtype=np.float32
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return recipe_ids, positions, versions, sparse.diags(1 / norms) @ matrix
+
+
+def top_neighbours(matrix, rows, top_k, batch_size):
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        scores = (matrix[batch] @ transposed).tocsr()
+        for offset, row in enumerate(batch):
+            begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+            columns = scores.indices[begin:end]
+            values = scores.data[begin:end]
+            keep = columns != row
+            columns, values = columns[keep], values[keep]
+            if len(values) > top_k:
+                best = np.argpartition(-values, top_k)[:top_k]
+                columns, values = columns[best], values[best]
+            order = np.argsort(-values, kind='stable')
+            yield row, columns[order], values[order]
+
+
+def compute(recipe_ids, matrix, rows, top_k, batch_size):
+    return {
+        recipe_ids[row]: [
+            (recipe_ids[column], float(score))
+            for column, score in zip(columns, values)
+        ]
+        for row, columns, values in top_neighbours(
+            matrix, rows, top_k, batch_size
+        )
+    }
+
+
+def clear_stale(recipe_ids, versions):
+    # Рецепт, изменённый после чтения матрицы, остаётся помеченным: его
+    # similar_version уже не совпадает с прочитанной.
+    by_version = {}
+    for pk in recipe_ids:
+        if pk in versions:
+            by_version.setdefault(versions[pk], []).append(pk)
+    for version, pks in by_version.items():
+        Recipe.objects.filter(
+            pk__in=pks, similar_stale=True, similar_version=version
+        ).update(similar_stale=False)
+
+
+def refresh(top_k, batch_size, full=False):
+    recipe_ids, positions, versions, matrix = load_matrix()
+    if full:
+        neighbours = compute(
+            recipe_ids, matrix, list(range(len(recipe_ids))),
+            top_k, batch_size
+        )
+    else:
+        stale = set(Recipe.objects.filter(
+            similar_stale=True
+        ).values_list('pk', flat=True))
+        neighbours = compute(
+            recipe_ids, matrix,
+            [positions[pk] for pk in stale if pk in positions],
+            top_k, batch_size
+        )
+        # Изменённый рецепт мог войти в список соседей или выпасть из
+        # него: пересчитываются рецепты, которые на него ссылались, и
+        # его новые соседи. Точный пересчёт всех списков — режим full.
+        affected = set(SimilarRecipe.objects.filter(
+            similar_id__in=stale
+        ).values_list('recipe_id', flat=True))
+        for links in neighbours.values():
+            affected.update(pk for pk, _ in links)
+        neighbours.update(compute(
+            recipe_ids, matrix,
+            [positions[pk] for pk in affected - stale if pk in positions],
+            top_k, batch_size
+        ))
+    with transaction.atomic():
+        if full:
+            SimilarRecipe.objects.all().delete()
+            clear_stale(
+                Recipe.objects.filter(
+                    similar_stale=True
+                ).values_list('pk', flat=True),
+                versions
+            )
+        else:
+            SimilarRecipe.objects.filter(
+                recipe_id__in=list(neighbours)
+            ).delete()
+            clear_stale(neighbours, versions)
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(recipe_id=recipe_id, similar_id=pk, score=score)
+                for recipe_id, links in neighbours.items()
+                for pk, score in links
+            ),
+            batch_size=batch_size
+        )
+        bump_reference_version_on_commit('recipes')
+    return len(neighbours)
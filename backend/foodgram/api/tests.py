@@ -0,0 +1,408 @@
+import json
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import similarity
+from api.authentication import token_cache
+from api.cooking import CookingIndex
+from api.management.commands.check_query_plans import seq_scans
+from recipes.models import (FeedItem, Ingredient, Recipe, RecipeIngredient,
+                            Tag)
+from users.models import Follow, User
+
+
+class RecipeDataTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}',
+                               color=f'#00000{i}')
+            for i in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(10)
+        ])
+        authors = [
+            User.objects.create(username=f'author{i}',
+                                email=f'author{i}@example.com',
+                                password=f'password{i}',
+                                first_name='Имя', last_name='Фамилия')
+            for i in range(3)
+        ]
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com',
+            password='password', first_name='Имя', last_name='Фамилия'
+        )
+        Follow.objects.create(user=cls.user, following=authors[0])
+        for i in range(15):
+            recipe = Recipe.objects.create(
+                author=authors[i % 3], name=f'Рецепт {i}', text='Текст',
+                cooking_time=10, image='recipes/images/recipe.png'
+            )
+            recipe.tags.set(tags[:1 + i % 3])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe,
+                                 ingredient=ingredients[(i + k) % 10],
+                                 amount=10 + k)
+                for k in range(3)
+            ])
+        cls.recipe = recipe
+        cls.user.favorite_recipes.add(recipe)
+        cls.user.shopping_cart.add(recipe)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.delete(self.token.key)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeQueryCountTest(RecipeDataTestCase):
+    def assert_queries(self, url, count):
+        # Первый запрос прогревает кэш токенов и справочников, считается
+        # второй — так же, как при работе сервера.
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.assertNumQueries(count):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_does_not_depend_on_page_size(self):
+        for limit in (1, 5, 10):
+            with self.subTest(limit=limit):
+                response = self.assert_queries(
+                    f'/api/recipes/?limit={limit}', 5
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_retrieve(self):
+        self.assert_queries(f'/api/recipes/{self.recipe.pk}/', 4)
+
+    def test_requested_fields_skip_relations(self):
+        response = self.assert_queries(
+            '/api/recipes/?limit=10&fields=id,name,cooking_time', 2
+        )
+        self.assertEqual(
+            set(response.data['results'][0]), {'id', 'name', 'cooking_time'}
+        )
+
+
+class RecipeCursorTest(RecipeDataTestCase):
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_cursor_follows_ordering(self):
+        for recipe, count in zip(Recipe.objects.all(), (3, 1, 3, 0, 2)):
+            Recipe.objects.filter(pk=recipe.pk).update(favorites_count=count)
+        self.assertEqual(
+            self.walk('/api/recipes/?cursor=&limit=4&ordering=-popular'),
+            list(Recipe.objects.order_by(
+                '-favorites_count', '-id'
+            ).values_list('pk', flat=True))
+        )
+
+    def test_cursor_with_search_is_rejected(self):
+        response = self.client.get('/api/recipes/?cursor=&search=Рецепт')
+        self.assertEqual(response.status_code, 400)
+
+
+class AnonymousCacheTest(RecipeDataTestCase):
+    def test_favorite_invalidates_cached_recipe(self):
+        recipe = Recipe.objects.exclude(pk=self.recipe.pk).first()
+        url = f'/api/recipes/{recipe.pk}/'
+        anonymous = APIClient()
+        self.assertEqual(
+            json.loads(anonymous.get(url).content)['favorites_count'], 0
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{url}favorite/')
+        self.assertEqual(
+            json.loads(anonymous.get(url).content)['favorites_count'], 1
+        )
+
+    def test_favorite_keeps_other_cached_recipes(self):
+        first, second = Recipe.objects.exclude(pk=self.recipe.pk)[:2]
+        anonymous = APIClient()
+        anonymous.get(f'/api/recipes/{first.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{second.pk}/favorite/')
+        with self.assertNumQueries(0):
+            anonymous.get(f'/api/recipes/{first.pk}/')
+
+    def test_favorites_refresh_list_once_per_interval(self):
+        anonymous = APIClient()
+
+        def counts():
+            response = anonymous.get('/api/recipes/?limit=20')
+            return {
+                recipe['id']: recipe['favorites_count']
+                for recipe in json.loads(response.content)['results']
+            }
+
+        first, second = Recipe.objects.exclude(pk=self.recipe.pk)[:2]
+        counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{first.pk}/favorite/')
+        self.assertEqual(counts()[first.pk], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{second.pk}/favorite/')
+        self.assertEqual(counts()[second.pk], 0)
+
+
+class CounterTest(RecipeDataTestCase):
+    def test_delete_relation_created_without_api(self):
+        # Так выглядят данные, записанные до появления счётчиков: связь
+        # есть, а счётчик остался нулевым.
+        recipe = Recipe.objects.exclude(pk=self.recipe.pk).first()
+        User.favorite_recipes.through.objects.bulk_create([
+            User.favorite_recipes.through(user=self.user, recipe=recipe)
+        ])
+        response = self.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_orm_writes_update_counters(self):
+        recipe = Recipe.objects.exclude(author__followers__user=self.user)[0]
+        self.user.shopping_cart.add(recipe)
+        Follow.objects.create(user=self.user, following=recipe.author)
+        recipe.refresh_from_db()
+        recipe.author.refresh_from_db()
+        self.assertEqual(recipe.in_carts_count, 1)
+        self.assertEqual(recipe.author.followers_count, 1)
+        self.assertEqual(recipe.author.recipes_count, 5)
+        self.user.shopping_cart.clear()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.in_carts_count, 0)
+        recipe.delete()
+        recipe.author.refresh_from_db()
+        self.assertEqual(recipe.author.recipes_count, 4)
+        response = self.client.delete(
+            f'/api/users/{recipe.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        recipe.author.refresh_from_db()
+        self.assertEqual(recipe.author.followers_count, 0)
+
+
+class TokenCacheTest(RecipeDataTestCase):
+    def test_set_password_keeps_counters(self):
+        self.user.set_password('old-password')
+        self.user.save()
+        self.client.get('/api/users/me/')
+        User.objects.filter(pk=self.user.pk).update(
+            recipes_count=F('recipes_count') + 5
+        )
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-password',
+            'new_password': 'New-password-123',
+        })
+        self.assertEqual(response.status_code, 204)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.recipes_count, self.user.recipes_count + 5)
+        self.assertTrue(user.check_password('New-password-123'))
+
+    def test_shared_cache_has_no_password(self):
+        token_cache.shared = True
+        try:
+            self.client.get('/api/users/me/')
+            token_cache.entries.clear()
+            self.assertNotIn('password', cache.get(
+                token_cache.shared_key(self.token.key)
+            )[0])
+            user, token = token_cache.get(self.token.key)
+        finally:
+            token_cache.shared = False
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token.key, self.token.key)
+        self.assertEqual(user.get_deferred_fields(), {'password'})
+
+
+class CookingIndexTest(RecipeDataTestCase):
+    def test_other_process_applies_delta_without_rebuild(self):
+        writer, reader = CookingIndex(), CookingIndex()
+        writer.get()
+        reader.get()
+        ingredient_ids = list(Ingredient.objects.values_list(
+            'pk', flat=True
+        )[:2])
+        recipe = Recipe.objects.exclude(pk=self.recipe.pk).first()
+        old_ids = list(recipe.ingredients.values_list(
+            'ingredient_id', flat=True
+        ))
+        recipe.ingredients.all().delete()
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=1)
+            for pk in ingredient_ids
+        ])
+        writer.update_recipe(recipe.pk, old_ids, ingredient_ids)
+        reader.build = None
+        self.assertIn((recipe.pk, 2, 0), reader.match(ingredient_ids, 20))
+        self.assertEqual(
+            reader.match(ingredient_ids, 20),
+            writer.match(ingredient_ids, 20)
+        )
+
+
+class SimilarRecipesTest(RecipeDataTestCase):
+    def test_edit_during_refresh_stays_stale(self):
+        similarity.refresh(10, 100, full=True)
+        edited, during, untouched = Recipe.objects.order_by('pk')[:3]
+        Recipe.objects.filter(
+            pk__in=(edited.pk, untouched.pk)
+        ).mark_similar_stale()
+        load_matrix = similarity.load_matrix
+
+        def load_then_edit():
+            try:
+                return load_matrix()
+            finally:
+                Recipe.objects.filter(
+                    pk__in=(edited.pk, during.pk)
+                ).mark_similar_stale()
+
+        with mock.patch.object(similarity, 'load_matrix', load_then_edit):
+            similarity.refresh(10, 100)
+        self.assertEqual(
+            set(Recipe.objects.filter(similar_stale=True).values_list(
+                'pk', flat=True
+            )),
+            {edited.pk, during.pk}
+        )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN для PostgreSQL')
+class QueryPlanTest(RecipeDataTestCase):
+    def test_no_seq_scans(self):
+        self.assertEqual(
+            {name: relations
+             for name, relations in seq_scans(self.user).items()
+             if relations},
+            {}
+        )
+
+
+class LatestPerAuthorTest(TestCase):
+    def test_same_pub_date_does_not_exceed_limit(self):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+            password='password', first_name='Имя', last_name='Фамилия'
+        )
+        Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'Рецепт {i}', text='Текст',
+                   cooking_time=10, image='recipes/images/recipe.png')
+            for i in range(5)
+        ])
+        Recipe.objects.update(pub_date=Recipe.objects.first().pub_date)
+        latest = Recipe.objects.latest_per_author(3)
+        self.assertEqual(
+            list(latest.values_list('pk', flat=True)),
+            list(Recipe.objects.order_by('-id').values_list(
+                'pk', flat=True
+            )[:3])
+        )
+
+
+class DedupeIngredientsTest(TransactionTestCase):
+    def setUp(self):
+        # Повторы появились до ограничения unique_ingredient, поэтому на
+        # время теста оно снимается. SQLite пересоздаёт таблицу по
+        # описанию модели, так что ограничение убирается и из него.
+        constraints = Ingredient._meta.constraints
+        Ingredient._meta.constraints = ()
+        self.addCleanup(self.restore_constraints, constraints)
+        with connection.schema_editor() as editor:
+            for constraint in constraints:
+                editor.remove_constraint(Ingredient, constraint)
+
+    def restore_constraints(self, constraints):
+        Recipe.objects.all().delete()
+        Ingredient.objects.all().delete()
+        Ingredient._meta.constraints = constraints
+        with connection.schema_editor() as editor:
+            for constraint in constraints:
+                editor.add_constraint(Ingredient, constraint)
+
+    def test_recipes_move_to_remaining_ingredient(self):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+            password='password', first_name='Имя', last_name='Фамилия'
+        )
+        salt, copy, other_copy, pepper = Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Соль', 'Соль', 'Соль', 'Перец')
+        ])
+        first, second = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=10, image='recipes/images/recipe.png'
+            )
+            for i in range(2)
+        ]
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=first, ingredient=salt, amount=5),
+            RecipeIngredient(recipe=first, ingredient=copy, amount=7),
+            RecipeIngredient(recipe=second, ingredient=other_copy, amount=3),
+            RecipeIngredient(recipe=second, ingredient=pepper, amount=1),
+        ])
+        call_command('dedupe_ingredients', '--dry-run', stdout=StringIO())
+        self.assertEqual(Ingredient.objects.count(), 4)
+        call_command('dedupe_ingredients', stdout=StringIO())
+        self.assertEqual(
+            set(Ingredient.objects.values_list('pk', flat=True)),
+            {salt.pk, pepper.pk}
+        )
+        self.assertEqual(
+            set(RecipeIngredient.objects.values_list(
+                'recipe', 'ingredient', 'amount'
+            )),
+            {(first.pk, salt.pk, 12), (second.pk, salt.pk, 3),
+             (second.pk, pepper.pk, 1)}
+        )
+
+
+class FeedTest(RecipeDataTestCase):
+    def feed_ids(self):
+        response = self.client.get('/api/recipes/feed/?limit=20')
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def followed_ids(self):
+        return set(Recipe.objects.filter(
+            author__followers__user=self.user
+        ).values_list('pk', flat=True))
+
+    def test_follow_created_in_db(self):
+        follow = Follow.objects.create(
+            user=self.user, following=self.recipe.author
+        )
+        self.assertEqual(self.feed_ids(), self.followed_ids())
+        follow.delete()
+        self.assertEqual(self.feed_ids(), self.followed_ids())
+
+    def test_backfill_existing_follows(self):
+        # Подписки и рецепты, записанные до появления ленты, сигналов не
+        # вызывали, и лента для них пуста.
+        FeedItem.objects.all().delete()
+        Follow.objects.bulk_create([
+            Follow(user=self.user, following=self.recipe.author)
+        ])
+        self.assertEqual(self.feed_ids(), set())
+        call_command('backfill_feed', stdout=StringIO())
+        self.assertEqual(self.feed_ids(), self.followed_ids())
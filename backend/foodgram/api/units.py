@@ -0,0 +1,46 @@
+import re
+
+from .reference import ingredients
+
+# Ключ — единица без регистра, пробелов и точек: «ст. л.», «ст.л.» и
+# «Ст. Л.» приводятся к одной записи. Значение — каноническая единица и
+# множитель перевода в неё.
+CANONICAL_UNITS = {
+    'г': ('г', 1),
+    'гр': ('г', 1),
+    'грамм': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'литр': ('мл', 1000),
+    'стакан': ('мл', 250),
+    'стл': ('мл', 15),
+    'чл': ('мл', 5),
+    'шт': ('шт.', 1),
+    'штука': ('шт.', 1),
+}
+
+
+def parse_unit(text):
+    key = re.sub(r'[\s.]', '', text.lower())
+    return CANONICAL_UNITS.get(key, (text.strip(), 1))
+
+
+class UnitTable:
+    def __init__(self, reference):
+        self.reference = reference
+        self.snapshot = (None, {})
+
+    def get(self):
+        catalog = self.reference.get()
+        if self.snapshot[0] is not catalog:
+            self.snapshot = (catalog, {
+                unit: parse_unit(unit)
+                for unit in {
+                    item['measurement_unit'] for item in catalog.items
+                }
+            })
+        return self.snapshot[1]
+
+
+unit_table = UnitTable(ingredients)
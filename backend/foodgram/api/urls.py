@@ -1,8 +1,9 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (APIFavoritesList, APIShoppingCart, IngredientViewSet,
-                    RecipeViewSet, TagViewSet, UserViewSet)
+from .views import (APIFavoritesList, APIShoppingCart, APIShoppingCartClear,
+                    IngredientViewSet, RecipeViewSet, TagViewSet,
+                    UserViewSet)
 
 app_name = 'api'
 
@@ -35,6 +36,9 @@ users_patterns = [
 ]
 
 recipes_patterns = [
+    path('favorite/', APIFavoritesList.as_view()),
+    path('shopping_cart/', APIShoppingCart.as_view()),
+    path('shopping_cart/clear/', APIShoppingCartClear.as_view()),
     path('<int:recipe_pk>/favorite/', APIFavoritesList.as_view()),
     path('<int:recipe_pk>/shopping_cart/', APIShoppingCart.as_view()),
 ]
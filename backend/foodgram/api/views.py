@@ -1,8 +1,16 @@
-import csv
+from foodgram.settings import (ANONYMOUS_CACHE_MAX_AGE,
+                               ANONYMOUS_CACHE_TIMEOUT,
+                               INGREDIENT_SEARCH_LIMIT)
 
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum, Value
+from django.db.models.functions import Greatest
 from django.shortcuts import get_object_or_404
-from django.core.exceptions import ValidationError
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.generics import ListAPIView, RetrieveAPIView
@@ -10,23 +18,82 @@ from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import SAFE_METHODS
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 from djoser.serializers import SetPasswordSerializer
 
-from recipes.models import Recipe, Tag, Ingredient
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            SimilarRecipe, Tag)
 from users.models import User, Follow
-from .filters import RecipeFilter, IngredientSearchFilter
+from .cache import (bump_recipe_counters_on_commit, cache_stream,
+                    invalidate_shopping_list, response_etag, response_key,
+                    response_version, shopping_list_key,
+                    shopping_list_version)
+from .cooking import cooking_index
+from .feed import feed_queryset, followed, unfollowed
+from .filters import RecipeFilter
+from .pagination import FeedPagination, KeysetPagination
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (RecipeReadSerializer, TagSerializer,
+from .renderers import (CSVShoppingListRenderer, PDFShoppingListRenderer,
+                        TextShoppingListRenderer)
+from .reference import ingredients, tags
+from .relations import add_links, remove_links
+from .search import ingredient_index
+from .serializers import (CookableRecipeSerializer, CookQuerySerializer,
+                          RecipeReadSerializer, TagSerializer,
                           IngredientSerializer, UserSerializer,
                           RecipeFavoritesShoppingCartSerializer,
-                          RecipeWriteSerializer)
+                          RecipeIdsReplaceSerializer, RecipeIdsSerializer,
+                          RecipeWriteSerializer, SimilarRecipeSerializer,
+                          get_recipes_limit, get_requested_fields)
+from .units import unit_table
+
+
+class AnonymousCacheMixin:
+    # Версии справочников, от которых зависит ответ; их смена
+    # сигналами записи делает все закэшированные ответы устаревшими.
+    cache_versions = ()
+
+    def get_cache_versions(self, kwargs):
+        return self.cache_versions
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or 'HTTP_AUTHORIZATION' in request.META:
+            response = super().dispatch(request, *args, **kwargs)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+            return response
+        key = response_key(request, response_version(
+            *self.get_cache_versions(kwargs)
+        ))
+        cached = cache.get(key)
+        if cached is None:
+            response = super().dispatch(request, *args, **kwargs)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            response.render()
+            cached = (
+                response_etag(response.content),
+                response['Content-Type'],
+                response.content
+            )
+            cache.set(key, cached, ANONYMOUS_CACHE_TIMEOUT)
+        etag, content_type, content = cached
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        patch_cache_control(
+            response, public=True, max_age=ANONYMOUS_CACHE_MAX_AGE
+        )
+        return response
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeReadSerializer
     permission_classes = (IsAuthorOrReadOnly,)
@@ -36,7 +103,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         'patch',
         'delete'
     )
-    pagination_class = LimitOffsetPagination
+    pagination_class = FeedPagination
+    cache_versions = ('recipes', 'tags', 'ingredients')
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     filterset_fields = ('author', 'tags')
@@ -47,59 +115,285 @@ class RecipeViewSet(viewsets.ModelViewSet):
         'is_in_shopping_cart'
     )
 
+    def get_cache_versions(self, kwargs):
+        # Счётчики избранного и списков покупок сбрасывают ответ с самим
+        # рецептом сразу, а списки — по общей версии счётчиков.
+        if self.action_map.get('get') == 'retrieve':
+            return (*self.cache_versions, f'recipe:{kwargs["pk"]}')
+        return (*self.cache_versions, 'recipe_counters')
+
+    def get_prefetches(self):
+        return {
+            'tags': 'tags',
+            'ingredients': Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        }
+
+    def get_queryset(self):
+        # Связи и аннотации подбираются по полям ответа: поле, которого
+        # нет в ?fields=, не стоит ни запроса, ни JOIN.
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve', 'feed'):
+            return queryset.with_user_flags(self.request.user)
+        fields = get_requested_fields(
+            self.request, RecipeReadSerializer.Meta.fields
+        )
+        if fields & {'is_favorited', 'is_in_shopping_cart'}:
+            queryset = queryset.with_user_flags(self.request.user)
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        if 'text' not in fields:
+            queryset = queryset.defer('text')
+        return queryset.prefetch_related(*(
+            lookup for field, lookup in self.get_prefetches().items()
+            if field in fields
+        ))
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_cursor_fields(self):
+        if self.action == 'feed':
+            return ('-feed_pub_date', '-pk')
+        params = self.request.query_params
+        if params.get('search', '').strip():
+            # Ранг поиска вычисляется при каждом запросе и не годится
+            # для курсора; выдача поиска листается по страницам.
+            raise ValidationError(
+                {'cursor': ['Курсор нельзя сочетать с поиском.']}
+            )
+        # Курсор строится по той же сортировке, что выбрана в ordering,
+        # а pk делает позицию однозначной при равных значениях.
+        param_map = RecipeFilter.base_filters['ordering'].param_map
+        fields = [
+            ('-' if value.startswith('-') else '')
+            + param_map[value.lstrip('-')]
+            for value in params.get('ordering', '').split(',')
+            if value.lstrip('-') in param_map
+        ]
+        if not fields:
+            return ('-pub_date', '-pk')
+        return (*fields, '-pk')
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(
             author=self.request.user
         )
 
-    @action(methods=('get',), detail=False)
+    @action(methods=('get',), detail=False,
+            permission_classes=(permissions.IsAuthenticated,),
+            pagination_class=KeysetPagination)
+    def feed(self, request):
+        page = self.paginate_queryset(
+            feed_queryset(self.get_queryset(), request.user)
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=False,
+            permission_classes=(permissions.IsAuthenticated,),
+            renderer_classes=(CSVShoppingListRenderer,
+                              TextShoppingListRenderer,
+                              PDFShoppingListRenderer))
     def download_shopping_cart(self, request):
-        recipes = Recipe.objects.filter(users_who_shopped=request.user)
-        ingredients = recipes.values(
-            'ingredients__ingredient__name',
-            'ingredients__amount',
-            'ingredients__ingredient__measurement_unit'
-        )
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = ('attachment; '
-                                           'filename="shopping_list.csv"')
-        writer = csv.writer(response)
-        writer.writerow(['Название', 'Количество'])
-        for obj in ingredients:
-            writer.writerow([
-                obj['ingredients__ingredient__name'],
-                obj['ingredients__amount'],
-                obj['ingredients__ingredient__measurement_unit']
-            ])
+        renderer = request.accepted_renderer
+        version = shopping_list_version(request.user.pk)
+        etag = f'"{request.user.pk}-{version}-{renderer.format}"'
+        last_modified = version // 10 ** 9
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            response['ETag'] = etag
+            return response
+        key = shopping_list_key(request.user.pk, version, renderer.format)
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=renderer.media_type)
+        else:
+            ingredients = RecipeIngredient.objects.shopping_list(
+                request.user, unit_table.get()
+            )
+            rows = (
+                (
+                    obj['ingredient__name'],
+                    obj['total_amount'],
+                    obj['unit']
+                )
+                for obj in ingredients.iterator()
+            )
+            response = StreamingHttpResponse(
+                cache_stream(renderer.stream(rows), key),
+                content_type=renderer.media_type
+            )
+        response['Content-Disposition'] = (
+            'attachment; '
+            f'filename="shopping_list.{renderer.format}"'
+        )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
         return response
 
+    @action(methods=('get',), detail=False)
+    def cook(self, request):
+        query = CookQuerySerializer(data={
+            'ingredients': request.query_params.getlist('ingredients'),
+            **{
+                name: request.query_params[name]
+                for name in ('max_missing', 'limit')
+                if name in request.query_params
+            }
+        })
+        query.is_valid(raise_exception=True)
+        matches = cooking_index.match(
+            query.validated_data['ingredients'],
+            query.validated_data['limit'],
+            query.validated_data.get('max_missing')
+        )
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        found = []
+        for recipe_id, matched, missing in matches:
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.matched_count, recipe.missing_count = matched, missing
+                found.append(recipe)
+        return Response(CookableRecipeSerializer(found, many=True).data)
+
+    @action(methods=('get',), detail=True)
+    def similar(self, request, pk):
+        links = SimilarRecipe.objects.filter(
+            recipe_id=pk
+        ).select_related('similar').order_by('-score', 'similar_id')
+        recipes = []
+        for link in links:
+            link.similar.score = link.score
+            recipes.append(link.similar)
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(SimilarRecipeSerializer(recipes, many=True).data)
+
+    @action(methods=('get',), detail=True)
+    def summary(self, request, pk):
+        amounts = RecipeIngredient.objects.filter(
+            recipe_id=pk
+        ).with_normalized_units(unit_table.get())
+        ingredients = [
+            {
+                'id': obj['ingredient_id'],
+                'name': obj['ingredient__name'],
+                'amount': obj['normalized_amount'],
+                'measurement_unit': obj['unit']
+            }
+            for obj in amounts.values(
+                'ingredient_id', 'ingredient__name', 'normalized_amount',
+                'unit'
+            ).order_by('ingredient__name')
+        ]
+        if not ingredients:
+            get_object_or_404(Recipe, pk=pk)
+        totals = [
+            {'amount': obj['amount'], 'measurement_unit': obj['unit']}
+            for obj in amounts.values('unit').annotate(
+                amount=Sum('normalized_amount')
+            ).order_by('unit')
+        ]
+        return Response({
+            'id': int(pk),
+            'ingredients': ingredients,
+            'totals': totals
+        })
+
+    def perform_destroy(self, instance):
+        user_ids = list(
+            instance.users_who_shopped.values_list('pk', flat=True)
+        )
+        recipe_id = instance.pk
+        ingredient_ids = list(
+            instance.ingredients.values_list('ingredient_id', flat=True)
+        )
+        instance.delete()
+        invalidate_shopping_list(*user_ids)
+        cooking_index.update_recipe(recipe_id, ingredient_ids, ())
+
+
+class ReferenceDataMixin:
+    reference = None
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def list(self, request, *args, **kwargs):
+        return Response(self.reference.get().items)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            item = self.reference.get().by_id[int(kwargs['pk'])]
+        except (KeyError, ValueError):
+            return super().retrieve(request, *args, **kwargs)
+        return Response(item)
+
+
+class TagViewSet(AnonymousCacheMixin, ReferenceDataMixin,
+                 viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    reference = tags
+    cache_versions = ('tags',)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(AnonymousCacheMixin, ReferenceDataMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('name',)
+    reference = ingredients
+    cache_versions = ('ingredients',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(name, INGREDIENT_SEARCH_LIMIT))
 
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('pk')
     serializer_class = UserSerializer
     http_method_names = (
         'get',
         'post',
         'delete'
     )
-    pagination_class = LimitOffsetPagination
+    pagination_class = FeedPagination
+
+    def get_queryset(self):
+        queryset = self.prefetch_recipes(super().get_queryset())
+        if not self.request.user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=self.request.user,
+                following=OuterRef('pk')
+            ))
+        )
+
+    def prefetch_recipes(self, queryset):
+        return queryset.prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.latest_per_author(
+                    get_recipes_limit(self.request)
+                )
+            )
+        )
+
+    def get_cursor_fields(self):
+        if self.action == 'subscriptions':
+            return ('-follow_id',)
+        return ('pk',)
 
     def destroy(self, request, *args, **kwargs):
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -107,17 +401,23 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(methods=('get',), detail=False,
             permission_classes=(permissions.IsAuthenticated,))
     def me(self, request):
-        serializer = UserSerializer(request.user, context={'request': request})
+        # request.user может прийти из кэша токенов, поэтому счётчики
+        # перечитываются из базы.
+        serializer = UserSerializer(
+            self.get_queryset().get(pk=request.user.pk),
+            context={'request': request}
+        )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(methods=('get',), detail=False,
             permission_classes=(permissions.IsAuthenticated,))
     def subscriptions(self, request):
-        ids = request.user.follows.all().values_list(
-            'following',
-            flat=True
-        )
-        queryset = User.objects.filter(pk__in=ids)
+        queryset = self.prefetch_recipes(
+            User.objects.filter(followers__user=request.user)
+        ).annotate(
+            follow_id=F('followers__id'),
+            is_subscribed=Value(True)
+        ).order_by('-follow_id')
         page = self.paginate_queryset(queryset)
         serializer = UserSerializer(
             page, context={'request': request}, many=True)
@@ -127,31 +427,47 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=(permissions.IsAuthenticated,),
             url_path=r'(?P<user_pk>\d+)/subscribe')
     def subscribe(self, request, user_pk):
-        try:
-            following = get_object_or_404(User, pk=user_pk)
-            Follow.objects.create(
-                user=request.user,
-                following=following
+        if int(user_pk) == request.user.pk:
+            return Response(
+                {'errors': 'Нельзя подписаться на себя'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        following = get_object_or_404(User, pk=user_pk)
+        with transaction.atomic():
+            added = add_links(
+                Follow, 'user', 'following', request.user.pk, [following.pk]
             )
-            serializer = UserSerializer(
-                following, context={'request': request})
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        except ValidationError as err:
+            if added:
+                User.objects.filter(pk=following.pk).update(
+                    followers_count=F('followers_count') + 1
+                )
+                followed(request.user.pk, following.pk)
+        if not added:
             return Response(
-                {'errors': err.args[0]['__all__']},
+                {'errors': 'Вы уже подписаны на этого пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        following.followers_count += 1
+        following.is_subscribed = True
+        serializer = UserSerializer(
+            following, context={'request': request})
+        return Response(serializer.data,
+                        status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, user_pk):
-        follow = Follow.objects.filter(
-            user=request.user,
-            following=get_object_or_404(User, pk=user_pk)
-        )
-        if follow.exists():
-            follow.delete()
+        with transaction.atomic():
+            deleted = remove_links(
+                Follow, 'user', 'following', request.user.pk, [int(user_pk)]
+            )
+            if deleted:
+                User.objects.filter(pk=user_pk).update(
+                    followers_count=Greatest(F('followers_count') - 1, 0)
+                )
+                unfollowed(request.user.pk, int(user_pk))
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, pk=user_pk)
         return Response(
             {'errors': 'Вы не подписаны на этого пользователя'},
             status=status.HTTP_400_BAD_REQUEST
@@ -166,7 +482,9 @@ class UserViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         self.request.user.set_password(serializer.data["new_password"])
-        self.request.user.save()
+        # Пользователь запроса может быть копией из кэша токенов: полное
+        # сохранение затёрло бы счётчики, обновлённые через F().
+        self.request.user.save(update_fields=('password',))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -181,57 +499,117 @@ class UserDetail(RetrieveAPIView):
     serializer_class = UserSerializer
 
 
-class APIFavoritesList(APIView):
+class RecipeRelationView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    relation = None
+    counter = None
+    exists_message = None
+    missing_message = None
+
+    def get_recipe_ids(self, request, recipe_pk):
+        if recipe_pk is not None:
+            return [recipe_pk]
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def change(self, user, add=(), remove=(), clear=False):
+        through = getattr(User, self.relation).through
+        with transaction.atomic():
+            if clear:
+                removed = remove_links(
+                    through, 'user', 'recipe', user.pk, keep=add
+                )
+            else:
+                removed = remove_links(
+                    through, 'user', 'recipe', user.pk, remove
+                )
+            added = add_links(through, 'user', 'recipe', user.pk, add)
+            # Связи из данных, созданных до появления счётчиков, могли не
+            # попасть в счётчик, поэтому уменьшение не опускает его ниже 0.
+            for recipe_ids, delta in ((added, 1), (removed, -1)):
+                if recipe_ids:
+                    Recipe.objects.filter(pk__in=recipe_ids).update(**{
+                        self.counter: Greatest(F(self.counter) + delta, 0)
+                    })
+            if added or removed:
+                bump_recipe_counters_on_commit(added | removed)
+        if added or removed:
+            self.relation_changed(user)
+        return added, removed
+
+    def relation_changed(self, user):
+        pass
+
+    def serialize_many(self, recipe_ids):
+        return RecipeFavoritesShoppingCartSerializer(
+            Recipe.objects.filter(pk__in=recipe_ids).order_by('pk'),
+            many=True
+        ).data
+
+    def post(self, request, recipe_pk=None):
+        added, _ = self.change(
+            request.user, add=self.get_recipe_ids(request, recipe_pk)
+        )
+        if recipe_pk is None:
+            return Response(
+                self.serialize_many(added),
+                status=status.HTTP_201_CREATED
+            )
+        if not added:
+            get_object_or_404(Recipe, pk=recipe_pk)
+            return Response(
+                {'detail': self.exists_message},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = RecipeFavoritesShoppingCartSerializer(
+            Recipe.objects.get(pk=recipe_pk)
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def post(self, request, recipe_pk):
-
-        if not request.user.favorite_recipes.filter(pk=recipe_pk).exists():
-            recipe = get_object_or_404(Recipe, pk=recipe_pk)
-            request.user.favorite_recipes.add(recipe)
-            serializer = RecipeFavoritesShoppingCartSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(
-            {'detail': 'рецепт уже в избранном'},
-            status=status.HTTP_400_BAD_REQUEST
+    def delete(self, request, recipe_pk=None):
+        _, removed = self.change(
+            request.user, remove=self.get_recipe_ids(request, recipe_pk)
         )
+        if recipe_pk is None:
+            return Response(self.serialize_many(removed))
+        if not removed:
+            return Response(
+                {'errors': self.missing_message},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def delete(self, request, recipe_pk):
 
-        if request.user.favorite_recipes.filter(pk=recipe_pk).exists():
-            request.user.favorite_recipes.remove(get_object_or_404(
-                Recipe,
-                pk=recipe_pk
-            ))
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(
-            {'errors': 'рецепта нет в избранном'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+class APIFavoritesList(RecipeRelationView):
+    relation = 'favorite_recipes'
+    counter = 'favorites_count'
+    exists_message = 'рецепт уже в избранном'
+    missing_message = 'рецепта нет в избранном'
 
 
-class APIShoppingCart(APIView):
-    permission_classes = (permissions.IsAuthenticated,)
+class APIShoppingCart(RecipeRelationView):
+    relation = 'shopping_cart'
+    counter = 'in_carts_count'
+    exists_message = 'рецепт уже в списке покупок'
+    missing_message = 'рецепта нет в списке покупок'
 
-    def post(self, request, recipe_pk):
-        if not request.user.shopping_cart.filter(pk=recipe_pk).exists():
-            recipe = get_object_or_404(Recipe, pk=recipe_pk)
-            request.user.shopping_cart.add(recipe)
-            serializer = RecipeFavoritesShoppingCartSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(
-            {'detail': 'рецепт уже в списке покупок'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    def relation_changed(self, user):
+        invalidate_shopping_list(user.pk)
 
-    def delete(self, request, recipe_pk):
-        if request.user.shopping_cart.filter(pk=recipe_pk).exists():
-            request.user.shopping_cart.remove(get_object_or_404(
-                Recipe,
-                pk=recipe_pk
-            ))
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(
-            {'errors': 'рецепта нет в списке покупок'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    def put(self, request, recipe_pk=None):
+        if recipe_pk is not None:
+            return self.http_method_not_allowed(request)
+        serializer = RecipeIdsReplaceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        self.change(request.user, add=recipe_ids, clear=True)
+        return Response(self.serialize_many(recipe_ids))
+
+
+class APIShoppingCartClear(APIShoppingCart):
+    http_method_names = ('post', 'options')
+
+    def post(self, request):
+        _, removed = self.change(request.user, clear=True)
+        return Response(self.serialize_many(removed))
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -103,6 +104,29 @@ DATABASES = {
     }
 }
 
+# Миграции создаются при развёртывании, поэтому тестовая база строится
+# прямо по моделям. Таблицы всех приложений создаются одним проходом,
+# иначе внешние ключи пользователей ссылались бы на ещё не созданные
+# таблицы auth.
+if 'test' in sys.argv:
+    MIGRATION_MODULES = {
+        app: None for app in (
+            'admin', 'auth', 'contenttypes', 'sessions', 'authtoken',
+            'api', 'recipes', 'users',
+        )
+    }
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -155,11 +179,72 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'PAGE_SIZE': 10,
 }
 
+RECIPES_LIMIT_DEFAULT = 3
+
+RECIPES_LIMIT_MAX = 50
+
+RECIPES_BATCH_MAX = 100
+
+FEED_MAX_FOLLOWS = 500
+
+FEED_BACKFILL_SIZE = 100
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+RECIPE_IMAGE_RENDITIONS = {
+    'small': 320,
+    'medium': 640,
+    'large': 1280,
+}
+
+RECIPE_IMAGE_QUALITY = 85
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+REFERENCE_DATA_TTL = 60 * 5
+
+COOKING_INDEX_TTL = 60 * 30
+
+COOKING_INDEX_MAX_DELTAS = 1000
+
+COOKING_RESULTS_LIMIT = 20
+
+COOKING_RESULTS_MAX = 100
+
+SIMILAR_RECIPES_TOP_K = 10
+
+SIMILAR_RECIPES_TAG_WEIGHT = 0.5
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+
+SHOPPING_LIST_CACHE_MAX_SIZE = 1024 * 1024
+
+ANONYMOUS_CACHE_TIMEOUT = 60 * 10
+
+ANONYMOUS_CACHE_MAX_AGE = 5
+
+RECIPE_COUNTERS_CACHE_INTERVAL = 60
+
+TOKEN_CACHE_TTL = 30
+
+TOKEN_CACHE_SIZE = 10000
+
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='False') == 'True'
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
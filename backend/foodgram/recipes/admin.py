@@ -13,7 +13,9 @@ class RecipeAdmin(admin.ModelAdmin):
         'get_ingredients',
         'image',
         'cooking_time',
-        'pub_date'
+        'pub_date',
+        'favorites_count',
+        'in_carts_count'
     )
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
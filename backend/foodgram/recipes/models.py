@@ -1,5 +1,9 @@
+from foodgram.settings import RECIPE_SEARCH_CONFIG
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models
 
 import users.models as u_models
 
@@ -47,11 +51,95 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'ингредиент'
         verbose_name_plural = 'ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            ),
+        )
 
     def __str__(self) -> str:
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(
+                u_models.User.favorite_recipes.through.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                u_models.User.shopping_cart.through.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk')
+                )
+            )
+        )
+
+    def latest_per_author(self, limit):
+        # Для каждого автора подзапрос берёт первые limit рецептов по
+        # индексу (author, -pub_date, -id); id разрешает совпадения дат.
+        latest = self.model.objects.filter(
+            author=models.OuterRef('author')
+        ).order_by('-pub_date', '-id').values('pk')[:limit]
+        return self.filter(
+            pk__in=models.Subquery(latest)
+        ).order_by('-pub_date', '-id')
+
+    def mark_similar_stale(self):
+        # Версия отличает правку, сделанную во время пересчёта похожих
+        # рецептов, от уже учтённой этим пересчётом.
+        return self.update(
+            similar_stale=True,
+            similar_version=models.F('similar_version') + 1
+        )
+
+    def search(self, query):
+        if connections[self.db].vendor == 'postgresql':
+            search_query = SearchQuery(
+                query, config=RECIPE_SEARCH_CONFIG, search_type='websearch'
+            )
+            return self.filter(search_vector=search_query).annotate(
+                search_rank=SearchRank(models.F('search_vector'), search_query)
+            )
+        # Без PostgreSQL (SQLite в тестах) поиск выполняется в Python:
+        # LIKE в SQLite не различает регистр только для латиницы. Вес
+        # совпадения в названии, тексте и ингредиентах повторяет
+        # setweight A/B/C поискового вектора.
+        terms = [term.casefold() for term in query.split()]
+        ingredient_names = {}
+        for recipe_id, name in RecipeIngredient.objects.filter(
+            recipe__in=self.values('pk')
+        ).values_list('recipe_id', 'ingredient__name'):
+            ingredient_names.setdefault(recipe_id, []).append(name)
+        ranks = {}
+        for pk, name, text in self.values_list('pk', 'name', 'text'):
+            fields = (
+                (name.casefold(), 1.0),
+                (text.casefold(), 0.4),
+                (' '.join(ingredient_names.get(pk, ())).casefold(), 0.2),
+            )
+            weights = [
+                sum(weight for value, weight in fields if term in value)
+                for term in terms
+            ]
+            if all(weights):
+                ranks[pk] = sum(weights)
+        return self.filter(pk__in=ranks).annotate(search_rank=models.Case(
+            *(
+                models.When(pk=pk, then=models.Value(rank))
+                for pk, rank in ranks.items()
+            ),
+            default=models.Value(0.0),
+            output_field=models.FloatField()
+        ))
+
+
 class Recipe(models.Model):
     name = models.CharField(
         'название рецепта',
@@ -86,11 +174,53 @@ class Recipe(models.Model):
         'время приготовления',
         validators=(MinValueValidator(1, 'значение должно быть больше 1'),)
     )
+    favorites_count = models.PositiveIntegerField(
+        'в избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'в списках покупок',
+        default=0,
+        editable=False
+    )
+    # Заполняется триггером PostgreSQL из названия, текста и ингредиентов.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+    similar_stale = models.BooleanField(
+        'похожие рецепты устарели',
+        default=True,
+        editable=False,
+        db_index=True
+    )
+    similar_version = models.PositiveIntegerField(
+        'версия для похожих рецептов',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
         ordering = ['-pub_date']
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         return self.name
@@ -108,6 +238,53 @@ class Recipe(models.Model):
     get_ingredients.short_description = 'ингредиенты'
 
 
+class RecipeIngredientQuerySet(models.QuerySet):
+    def with_normalized_units(self, units):
+        # units: {единица из каталога: (каноническая единица, множитель)}.
+        # Перевод выполняется в SQL одним CASE по каждой величине, чтобы
+        # суммы считались в базе, а не построчно в Python.
+        by_unit, by_factor = {}, {}
+        for unit, (canonical, factor) in units.items():
+            if canonical != unit:
+                by_unit.setdefault(canonical, []).append(unit)
+            if factor != 1:
+                by_factor.setdefault(factor, []).append(unit)
+        return self.annotate(
+            unit=models.Case(
+                *(
+                    models.When(
+                        ingredient__measurement_unit__in=raw_units,
+                        then=models.Value(canonical)
+                    )
+                    for canonical, raw_units in by_unit.items()
+                ),
+                default=models.F('ingredient__measurement_unit'),
+                output_field=models.CharField()
+            ),
+            normalized_amount=models.Case(
+                *(
+                    models.When(
+                        ingredient__measurement_unit__in=raw_units,
+                        then=models.F('amount') * factor
+                    )
+                    for factor, raw_units in by_factor.items()
+                ),
+                default=models.F('amount'),
+                output_field=models.IntegerField()
+            )
+        )
+
+    def shopping_list(self, user, units):
+        return self.filter(
+            recipe__users_who_shopped=user
+        ).with_normalized_units(units).values(
+            'ingredient__name',
+            'unit'
+        ).annotate(
+            total_amount=models.Sum('normalized_amount')
+        ).order_by('ingredient__name', 'unit')
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -128,9 +305,91 @@ class RecipeIngredient(models.Model):
         blank=True
     )
 
+    objects = RecipeIngredientQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'количество ингредиента'
         verbose_name_plural = 'количества ингредиента'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            ),
+        )
 
     def __str__(self) -> str:
         return f'Рецепт - {self.recipe}, {self.ingredient} {self.amount}'
+
+
+class FeedItem(models.Model):
+    user = models.ForeignKey(
+        u_models.User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='читатель'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='рецепт'
+    )
+    pub_date = models.DateTimeField(
+        'дата публикации рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_links',
+        verbose_name='рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='похожий рецепт'
+    )
+    score = models.FloatField(
+        'сходство'
+    )
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score_idx'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.similar} похож на {self.recipe}'
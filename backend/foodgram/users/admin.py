@@ -10,6 +10,8 @@ class UserAdmin(admin.ModelAdmin):
         'last_name',
         'username',
         'email',
+        'recipes_count',
+        'followers_count',
         'get_favorite_recipes',
         'get_shopping_cart'
     )
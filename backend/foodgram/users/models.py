@@ -43,6 +43,16 @@ class User(AbstractUser):
         verbose_name='список покупок',
         blank=True
     )
+    followers_count = models.PositiveIntegerField(
+        'подписчики',
+        default=0,
+        editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        'рецепты',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'пользователь'
@@ -89,6 +99,12 @@ class Follow(models.Model):
                 violation_error_message='Нельзя подписаться на себя'
             )
         )
+        indexes = (
+            models.Index(
+                fields=('user', '-id'),
+                name='follow_user_id_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         return f'{self.user} подписан на {self.following}'